@@ -2,8 +2,10 @@
 from fastapi.responses import JSONResponse  
 from fastapi import FastAPI, HTTPException, Depends, status, Request, Body, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from kubernetes import client, config
+from kubernetes import client, config, watch
+from kubernetes.client.rest import ApiException
 from prometheus_client import generate_latest, Gauge
 import json
 import yaml
@@ -23,6 +25,9 @@ from dotenv import load_dotenv
 import sqlite3
 import shutil  # For file copying
 import time  # For retry delays
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +38,30 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Edge Computing Management API", version="1.0.0")
 
+# Blocking I/O (Kubernetes client, Prometheus, SQLite, SSH, subprocesses) runs in
+# bounded thread pools so it never stalls the event loop or the progress WebSocket.
+# Provisioning can hold a thread for minutes, so it gets its own pool and can't
+# starve the dashboard's API calls.
+API_WORKERS = int(os.getenv("API_WORKERS", "16"))
+PROVISION_WORKERS = int(os.getenv("PROVISION_WORKERS", "8"))
+api_pool = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="api")
+provision_pool = ThreadPoolExecutor(max_workers=PROVISION_WORKERS, thread_name_prefix="provision")
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a short blocking call (K8s API, Prometheus, DB) in the API pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(api_pool, functools.partial(func, *args, **kwargs))
+
+async def run_provisioning(func, *args, **kwargs):
+    """Run a long blocking call (SSH, installers, kubectl) in the provisioning pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(provision_pool, functools.partial(func, *args, **kwargs))
+
+@app.on_event("shutdown")
+def shutdown_pools():
+    api_pool.shutdown(wait=False)
+    provision_pool.shutdown(wait=False)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -119,6 +148,47 @@ def init_db():
 # Call init_db when the app starts
 init_db()
 
+def db_fetchall(query, params=()):
+    """Run a SELECT on nodes.db and return all rows"""
+    conn = sqlite3.connect('nodes.db')
+    try:
+        return conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+
+def db_execute(query, params=()):
+    """Run a single write statement on nodes.db"""
+    conn = sqlite3.connect('nodes.db')
+    try:
+        conn.execute(query, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+def store_node(name, ip, username, password, node_type, is_master=False):
+    """Insert or replace a pending node; a new master replaces the previous one"""
+    conn = sqlite3.connect('nodes.db')
+    c = conn.cursor()
+    try:
+        # First, update database schema if needed (add is_master column)
+        try:
+            c.execute("SELECT is_master FROM nodes LIMIT 1")
+        except sqlite3.OperationalError:
+            # Column doesn't exist, alter table
+            logger.info("Adding is_master column to nodes table")
+            c.execute("ALTER TABLE nodes ADD COLUMN is_master BOOLEAN DEFAULT 0")
+
+        # If setting as master, clear existing master
+        if is_master:
+            logger.info(f"Setting {name} as master node - clearing previous master")
+            c.execute("UPDATE nodes SET is_master = 0 WHERE is_master = 1")
+
+        c.execute("INSERT OR REPLACE INTO nodes (name, ip, username, password, type, is_master) VALUES (?, ?, ?, ?, ?, ?)",
+                  (name, ip, username, password, node_type, is_master))
+        conn.commit()
+    finally:
+        conn.close()
+
 # Master node configuration (hardcoded as per planning)
 MASTER_NAME = "nuc2"
 MASTER_IP = "192.168.0.147"  # Update if dynamic
@@ -132,14 +202,124 @@ FILES_TO_COPY = [
 ]  # /etc/rancher/k3s/k3s.yaml is generated, not copied
 
 # Load Kubernetes config (after deployment, it will be available)
-try:
-    config.load_kube_config(config_file=os.getenv("KUBECONFIG_PATH"))
+v1 = None
+apps_v1 = None
+
+def load_kube_clients(config_file=None):
+    """(Re)load the kubeconfig and replace the module-wide API clients"""
+    global v1, apps_v1
+    config.load_kube_config(config_file=config_file)
     v1 = client.CoreV1Api()
     apps_v1 = client.AppsV1Api()
+    # Caches requested before the cluster was deployed start watching now
+    for cache in cluster_cache.values():
+        if cache.wanted:
+            cache.start()
+
+# Watch-driven cache of cluster state: the dashboard endpoints read nodes, pods and
+# deployments from memory, so API-server load doesn't grow with viewers x refresh rate.
+WATCH_TIMEOUT = int(os.getenv("WATCH_TIMEOUT", "300"))
+CACHE_RETRY_SECONDS = float(os.getenv("CACHE_RETRY_SECONDS", "5"))
+# Client-side read timeout a little past the server's, so a half-open connection can't stall the cache
+WATCH_REQUEST_TIMEOUT = WATCH_TIMEOUT + 15
+
+class ResourceCache:
+    """Keeps a copy of one resource kind current with a LIST and resourceVersion watches"""
+    def __init__(self, kind, get_list):
+        self.kind = kind
+        # Returns the client's bound list method; Watch needs the real method to
+        # deserialize events into models and track their resourceVersion
+        self.get_list = get_list
+        self.items = {}
+        self.synced = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.wanted = False
+        self.listeners = []  # called from the watch thread with (kind, items, deleted, replace)
+
+    def start(self):
+        """Starts the watch thread, or only marks the cache wanted until the clients are loaded"""
+        with self.lock:
+            self.wanted = True
+            if self.thread is None and v1 is not None:
+                self.thread = threading.Thread(target=self.run, name=f"cache-{self.kind}", daemon=True)
+                self.thread.start()
+
+    def snapshot(self):
+        with self.lock:
+            return [self.items[key] for key in sorted(self.items)]
+
+    def run(self):
+        while True:
+            try:
+                resource_version = self.relist()
+                self.watch(resource_version)
+            except ApiException as e:
+                if e.status == 410:
+                    logger.info(f"{self.kind} watch expired, relisting")
+                    continue
+                logger.warning(f"{self.kind} watch failed: {e}")
+            except Exception as e:
+                logger.warning(f"{self.kind} watch failed: {e}")
+            # Readers fall back to a direct LIST until the cache has relisted
+            self.synced.clear()
+            time.sleep(CACHE_RETRY_SECONDS)
+
+    def relist(self):
+        result = self.get_list()()
+        with self.lock:
+            self.items = {(item.metadata.namespace, item.metadata.name): item for item in result.items}
+        self.synced.set()
+        self.notify(result.items, replace=True)
+        return result.metadata.resource_version
+
+    def notify(self, items, deleted=False, replace=False):
+        for listener in self.listeners:
+            try:
+                listener(self.kind, items, deleted, replace)
+            except Exception as e:
+                logger.error(f"{self.kind} cache listener failed: {e}")
+
+    def watch(self, resource_version):
+        # Watch from the LIST's resourceVersion; each timeout resumes where the last event left off
+        w = watch.Watch()
+        while True:
+            for event in w.stream(self.get_list(), resource_version=resource_version,
+                                  timeout_seconds=WATCH_TIMEOUT, allow_watch_bookmarks=True,
+                                  _request_timeout=WATCH_REQUEST_TIMEOUT):
+                if event["type"] not in ("ADDED", "MODIFIED", "DELETED"):
+                    continue
+                item = event["object"]
+                key = (item.metadata.namespace, item.metadata.name)
+                with self.lock:
+                    if event["type"] == "DELETED":
+                        self.items.pop(key, None)
+                    else:
+                        self.items[key] = item
+                self.notify([item], deleted=event["type"] == "DELETED")
+            resource_version = w.resource_version
+
+# The getters look up the module-wide clients, so the caches follow load_kube_clients
+cluster_cache = {
+    "nodes": ResourceCache("nodes", lambda: v1.list_node),
+    "pods": ResourceCache("pods", lambda: v1.list_pod_for_all_namespaces),
+    "deployments": ResourceCache("deployments", lambda: apps_v1.list_deployment_for_all_namespaces),
+}
+
+try:
+    load_kube_clients(os.getenv("KUBECONFIG_PATH"))
     logger.info("Successfully loaded Kubernetes config")
 except Exception as e:
     logger.warning(f"Kubernetes config not loaded yet: {e}. Will load after deployment.")
 
+async def cached_list(kind):
+    """Items of `kind` from the watch cache, or a direct LIST until it has synced"""
+    cache = cluster_cache[kind]
+    cache.start()
+    if cache.synced.is_set():
+        return cache.snapshot()
+    return (await run_blocking(cache.get_list())).items
+
 # Prometheus metrics
 CPU_GAUGE = Gauge('node_cpu_usage', 'CPU usage percentage', ['node', 'role'])
 MEMORY_GAUGE = Gauge('node_memory_usage', 'Memory usage percentage', ['node', 'role'])
@@ -355,45 +535,246 @@ def get_node_memory(node):
         return f"{int(memory_mb)} MB"
     return "N/A"
 
-async def get_real_cpu_usage(node_name):
-    """Get real CPU utilization from Prometheus using node labels"""
-    try:
-        prometheus_url = "http://localhost:9090/api/v1/query"
+def node_group(node_name):
+    """Dashboard page a node is listed on, by its naming convention"""
+    if "nuc" in node_name.lower() or "lim" in node_name.lower():
+        return "edge"
+    if "iot" in node_name.lower() or "rpi" in node_name.lower():
+        return "iot"
+    return None
 
-        # Method 1: Try with node label (cleanest approach)
-        query = f'100 - (avg by (node) (irate(node_cpu_seconds_total{{mode="idle", node="{node_name}"}}[5m])) * 100)'
+def node_row(node):
+    """Node as shown in the edge/IoT listings, without CPU"""
+    status = "offline"
+    for condition in node.status.conditions or []:
+        if condition.type == "Ready":
+            status = "online" if condition.status == "True" else "offline"
+            break
+    return {
+        "name": node.metadata.name,
+        "ip": get_node_ip(node),
+        "status": status,
+        "memory": get_node_memory(node)
+    }
 
-        response = requests.get(prometheus_url, params={"query": query}, timeout=5)
-        data = response.json()
-        
-        if (data["status"] == "success" and data["data"]["result"]):
-            cpu_usage = float(data["data"]["result"][0]["value"][1])
-            return f"{cpu_usage:.1f}%"
-
-        # Method 2: Fallback - try to find the node by IP
-        nodes = v1.list_node()
-        for node in nodes.items:
-            if node.metadata.name == node_name:
-                node_ip = get_node_ip(node)
-                if node_ip and node_ip != "N/A":
-                    query = f'100 - (avg by (instance) (irate(node_cpu_seconds_total{{mode="idle", instance=~".*{node_ip}.*"}}[5m])) * 100)'
-                    response = requests.get(prometheus_url, params={"query": query}, timeout=5)
-                    data = response.json()
-                    if (data["status"] == "success" and data["data"]["result"]):
-                        cpu_usage = float(data["data"]["result"][0]["value"][1])
-                        return f"{cpu_usage:.1f}%"
-                break
-
-        return "0%"  # No data found
-        
+def pod_row(pod):
+    return {
+        "name": pod.metadata.name,
+        "namespace": pod.metadata.namespace,
+        "node": pod.spec.node_name,
+        "status": pod.status.phase,
+        "ip": pod.status.pod_ip,
+        "created": pod.metadata.creation_timestamp,
+        "labels": pod.metadata.labels or {}
+    }
+
+def deployment_row(deployment):
+    return {
+        "name": deployment.metadata.name,
+        "namespace": deployment.metadata.namespace,
+        "replicas": deployment.status.replicas if deployment.status.replicas else 0,
+        "available": deployment.status.available_replicas if deployment.status.available_replicas else 0,
+        "ready": deployment.status.ready_replicas if deployment.status.ready_replicas else 0
+    }
+
+# Node CPU utilization comes from one Prometheus query for the whole cluster,
+# shared by all listings for CPU_REFRESH_SECONDS, instead of a query per node.
+PROMETHEUS_QUERY_URL = os.getenv("PROMETHEUS_URL", "http://localhost:9090/api/v1/query")
+CPU_REFRESH_SECONDS = float(os.getenv("CPU_REFRESH_SECONDS", "5"))
+NODE_CPU_QUERY = '100 - (avg by (node) (irate(node_cpu_seconds_total{mode="idle"}[5m])) * 100)'
+INSTANCE_CPU_QUERY = '100 - (avg by (instance) (irate(node_cpu_seconds_total{mode="idle"}[5m])) * 100)'
+cpu_cache = {"time": 0.0, "usage": {}}
+cpu_cache_lock = threading.Lock()
+
+def query_prometheus(query):
+    """Run an instant query and return its result vector"""
+    response = requests.get(PROMETHEUS_QUERY_URL, params={"query": query}, timeout=5)
+    data = response.json()
+    if data["status"] != "success":
+        raise Exception(f"Prometheus query failed: {data.get('error')}")
+    return data["data"]["result"]
+
+def fetch_cluster_cpu_usage(nodes):
+    """Get real CPU utilization of all nodes from Prometheus using node labels"""
+    usage = {}
+    for result in query_prometheus(NODE_CPU_QUERY):
+        node_name = result["metric"].get("node")
+        if node_name:
+            usage[node_name] = float(result["value"][1])
+
+    # Fallback - match nodes without a node label by IP, again in a single query
+    missing = {}
+    for node in nodes:
+        node_ip = get_node_ip(node)
+        if node.metadata.name not in usage and node_ip != "N/A":
+            missing[node_ip] = node.metadata.name
+    if missing:
+        for result in query_prometheus(INSTANCE_CPU_QUERY):
+            instance_ip = result["metric"].get("instance", "").rsplit(":", 1)[0]
+            if instance_ip in missing:
+                usage[missing[instance_ip]] = float(result["value"][1])
+
+    return {node_name: f"{cpu_usage:.1f}%" for node_name, cpu_usage in usage.items()}
+
+def get_cluster_cpu_usage(nodes):
+    """CPU utilization by node name, refreshed at most every CPU_REFRESH_SECONDS"""
+    with cpu_cache_lock:
+        if time.monotonic() - cpu_cache["time"] >= CPU_REFRESH_SECONDS:
+            try:
+                cpu_cache["usage"] = fetch_cluster_cpu_usage(nodes)
+            except Exception as e:
+                logger.error(f"Error getting CPU usage: {e}")
+                cpu_cache["usage"] = {}
+            cpu_cache["time"] = time.monotonic()
+        return cpu_cache["usage"]
+
+def fetch_offloading_decisions():
+    """Current placement of every workload the offloading manager controls"""
+    decisions = {}
+    for result in query_prometheus(OFFLOADING_QUERY):
+        labels = result["metric"]
+        decisions[f"{labels.get('namespace')}/{labels.get('workload')}"] = {
+            "namespace": labels.get("namespace"),
+            "workload": labels.get("workload"),
+            "placement": "edge" if float(result["value"][1]) >= 0.5 else "iot"
+        }
+    return decisions
+
+# Live cluster updates: clients subscribe to topics on /ws/cluster and get a snapshot,
+# then only the entries that changed. Cache topics are fed by the watch threads,
+# metrics and offloading decisions by one poller that runs while anyone listens.
+CLUSTER_TOPICS = ("nodes", "pods", "deployments", "metrics", "offloading")
+OFFLOADING_QUERY = "myapp_workload_offload_action"
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+
+class ClusterHub:
+    def __init__(self):
+        self.loop = None
+        self.subscribers = {topic: set() for topic in CLUSTER_TOPICS}
+        self.state = {topic: {} for topic in CLUSTER_TOPICS}
+        self.poller = None
+
+    def subscribe(self, queue, topics):
+        for topic in topics:
+            if topic not in self.subscribers:
+                self.send(queue, {"topic": topic, "type": "error", "data": "unknown topic"})
+                continue
+            self.subscribers[topic].add(queue)
+            if topic in cluster_cache:
+                cluster_cache[topic].start()
+            self.send(queue, {"topic": topic, "type": "snapshot", "data": self.state[topic]})
+        if self.poller is None and (self.subscribers["metrics"] or self.subscribers["offloading"]):
+            self.poller = asyncio.create_task(self.poll_metrics())
+
+    def unsubscribe(self, queue, topics=CLUSTER_TOPICS):
+        for topic in topics:
+            self.subscribers.get(topic, set()).discard(queue)
+
+    def send(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too slow to keep up: drop it, it gets a fresh snapshot when it reconnects
+            logger.warning("Cluster WebSocket client fell behind, disconnecting")
+            self.unsubscribe(queue)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def update(self, topic, rows, replace=False):
+        """Apply {key: row or None to delete} and push what changed, on the event loop"""
+        state = self.state[topic]
+        changes = {key: None for key in state.keys() - rows.keys()} if replace else {}
+        for key, row in rows.items():
+            if state.get(key) != row:
+                changes[key] = row
+        for key, row in changes.items():
+            if row is None:
+                state.pop(key, None)
+            else:
+                state[key] = row
+        if changes:
+            message = {"topic": topic, "type": "delta", "data": changes}
+            for queue in list(self.subscribers[topic]):
+                self.send(queue, message)
+
+    def on_cache_event(self, kind, items, deleted, replace):
+        # Called from a watch thread; node heartbeats don't change the row, so they aren't pushed
+        rows = {}
+        for item in items:
+            if kind == "nodes":
+                key, row = item.metadata.name, {**node_row(item), "group": node_group(item.metadata.name)}
+            elif kind == "pods":
+                key, row = f"{item.metadata.namespace}/{item.metadata.name}", jsonable_encoder(pod_row(item))
+            else:
+                key, row = f"{item.metadata.namespace}/{item.metadata.name}", deployment_row(item)
+            rows[key] = None if deleted else row
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.update, kind, rows, replace)
+
+    async def poll_metrics(self):
+        while self.subscribers["metrics"] or self.subscribers["offloading"]:
+            try:
+                if self.subscribers["metrics"]:
+                    nodes = await cached_list("nodes")
+                    cpu_usage = await run_blocking(get_cluster_cpu_usage, nodes)
+                    if cpu_usage:
+                        self.update("metrics", {name: {"cpu": cpu} for name, cpu in cpu_usage.items()}, replace=True)
+                if self.subscribers["offloading"]:
+                    self.update("offloading", await run_blocking(fetch_offloading_decisions), replace=True)
+            except Exception as e:
+                logger.error(f"Error polling cluster metrics: {e}")
+            await asyncio.sleep(CPU_REFRESH_SECONDS)
+        self.poller = None
+
+cluster_hub = ClusterHub()
+for cache in cluster_cache.values():
+    cache.listeners.append(cluster_hub.on_cache_event)
+
+@app.on_event("startup")
+async def start_cluster_hub():
+    cluster_hub.loop = asyncio.get_running_loop()
+
+async def send_cluster_updates(websocket: WebSocket, queue: asyncio.Queue):
+    while True:
+        message = await queue.get()
+        if message is None:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+            return
+        await websocket.send_json(message)
+
+@app.websocket("/ws/cluster")
+async def websocket_cluster(websocket: WebSocket, token: str = ""):
+    """Send {"subscribe": [topics]} or {"unsubscribe": [topics]}; updates arrive as
+    {"topic", "type": "snapshot" | "delta", "data": {key: row, or null when removed}}"""
+    try:
+        await get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+    sender = asyncio.create_task(send_cluster_updates(websocket, queue))
+    try:
+        while True:
+            request = await websocket.receive_json()
+            cluster_hub.subscribe(queue, request.get("subscribe", []))
+            cluster_hub.unsubscribe(queue, request.get("unsubscribe", []))
+    except WebSocketDisconnect:
+        logger.info("Cluster WebSocket client disconnected")
     except Exception as e:
-        logger.error(f"Error getting CPU usage for {node_name}: {e}")
-        return "0%"
+        logger.error(f"Cluster WebSocket error: {e}")
+    finally:
+        cluster_hub.unsubscribe(queue)
+        sender.cancel()
 
 # SSH Helper Functions
-def ssh_join_node_generic(ip, username, password, master_ip, token, node_name, role):
+def ssh_join_node_generic(ip, username, password, master_ip, token, node_name, role, ssh=None):
+    """Join a node to the cluster, over `ssh` if already connected (left open for the caller)"""
+    own_connection = ssh is None
     try:
-        ssh = ssh_connect_with_retry(ip, username, password)
+        if own_connection:
+            ssh = ssh_connect_with_retry(ip, username, password)
         if not ssh:
             return {"success": False, "error": f"Failed to connect to {ip} after multiple attempts"}
         
@@ -419,7 +800,8 @@ def ssh_join_node_generic(ip, username, password, master_ip, token, node_name, r
         sh -"""
         
         exit_status, output, error = ssh_execute_with_retry(ssh, join_cmd)
-        ssh.close()
+        if own_connection:
+            ssh.close()
 
         if exit_status == 0:
             logger.info(f"Successfully joined {role} node {node_name} to cluster")
@@ -440,6 +822,77 @@ def ssh_join_node_generic(ip, username, password, master_ip, token, node_name, r
         logger.error(error_msg)
         return {"success": False, "error": error_msg}
 
+# Worker nodes are provisioned concurrently, at most JOIN_CONCURRENCY at a time; each
+# holds one provisioning thread while a command runs, so keep PROVISION_WORKERS >= it.
+JOIN_CONCURRENCY = int(os.getenv("JOIN_CONCURRENCY", "4"))
+
+class JoinProgress:
+    """Overall progress of the concurrent node joins, mapped onto [start, end] percent"""
+    def __init__(self, total_steps, start=87, end=95):
+        self.total_steps = max(total_steps, 1)
+        self.done = 0
+        self.start = start
+        self.end = end
+
+    async def step(self, name, message, node_status="running", steps=1):
+        self.done += steps
+        percent = self.start + int((self.end - self.start) * min(self.done, self.total_steps) / self.total_steps)
+        await progress_manager.send_progress({
+            "type": "progress",
+            "percent": percent,
+            "message": f"[{name}] {message}",
+            "node": name,
+            "node_status": node_status
+        })
+
+def join_steps(node_type):
+    # SSH connect, each prerequisite command, k3s join
+    return len(get_installation_commands(node_type)) + 2
+
+async def provision_worker(name, ip, username, password, node_type, token, semaphore, join_progress):
+    """Install prerequisites on one node and join it; failures stay with this node"""
+    steps_left = join_steps(node_type)
+    ssh = None
+    async with semaphore:
+        try:
+            await join_progress.step(name, f"Setting up {ip} as {node_type}", steps=0)
+            logger.info(f"Setting up node: {name} ({ip}) as {node_type}")
+            ssh = await run_provisioning(ssh_connect_with_retry, ip, username, password)
+            if not ssh:
+                raise Exception(f"Failed to connect to {name}")
+            steps_left -= 1
+            await join_progress.step(name, "Connected, installing prerequisites")
+
+            # Install prerequisites based on node type
+            prereq_cmds = get_installation_commands(node_type)
+            for j, cmd in enumerate(prereq_cmds):
+                logger.info(f"  [{name}] Prereq [{j+1}/{len(prereq_cmds)}]: {cmd[:50]}...")
+                exit_status, output, error = await run_provisioning(ssh_execute_with_retry, ssh, cmd)
+                if exit_status != 0:
+                    logger.warning(f"Prereq command failed on {name}: {cmd}. Error: {error}")
+                steps_left -= 1
+                await join_progress.step(name, f"Prerequisite {j+1}/{len(prereq_cmds)} done")
+
+            # Join node to cluster over the same connection
+            role = 'edge' if node_type == 'edge' else 'iot'
+            logger.info(f"Joining {name} as {role} node...")
+            result = await run_provisioning(ssh_join_node_generic, ip, username, password, MASTER_IP, token, name, role, ssh=ssh)
+            if not result["success"]:
+                raise Exception(result["error"])
+
+            steps_left -= 1
+            await join_progress.step(name, "Successfully joined cluster", node_status="joined")
+            logger.info(f"Successfully joined {name} to cluster")
+            return {"name": name, "success": True}
+
+        except Exception as e:
+            logger.error(f"Failed to setup node {name}: {str(e)}")
+            await join_progress.step(name, f"Failed: {str(e)}", node_status="failed", steps=steps_left)
+            return {"name": name, "success": False, "error": str(e)}
+        finally:
+            if ssh:
+                ssh.close()
+
 # delete iot nodes
 def ssh_remove_node(ip, username, password, node_name):
     try:
@@ -464,7 +917,8 @@ def ssh_remove_node(ip, username, password, node_name):
 # API Routes 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(fake_users_db, form_data.username, form_data.password)
+    # bcrypt is deliberately slow, keep it off the event loop
+    user = await run_blocking(authenticate_user, fake_users_db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -496,32 +950,18 @@ async def get_edge_nodes(current_user: User = Depends(get_current_active_user)):
         # Get from K8s if available
         k8s_nodes_dict = {}
         try:
-            nodes = v1.list_node()
-            for node in nodes.items:
+            nodes = await cached_list("nodes")
+            cpu_usage = await run_blocking(get_cluster_cpu_usage, nodes)
+            for node in nodes:
                 node_name = node.metadata.name
-                if "nuc" in node_name.lower() or "lim" in node_name.lower():
-                    status = "offline"
-                    for condition in node.status.conditions:
-                        if condition.type == "Ready":
-                            status = "online" if condition.status == "True" else "offline"
-                            break
-                    cpu_usage = await get_real_cpu_usage(node_name)
-                    k8s_nodes_dict[node_name] = {
-                        "name": node_name,
-                        "ip": get_node_ip(node),
-                        "status": status,
-                        "cpu": cpu_usage,
-                        "memory": get_node_memory(node)
-                    }
+                if node_group(node_name) == "edge":
+                    k8s_nodes_dict[node_name] = {**node_row(node), "cpu": cpu_usage.get(node_name, "0%")}
         except Exception as e:
             logger.warning(f"K8s not available yet: {e}")
 
         # Get from DB
-        conn = sqlite3.connect('nodes.db')
-        c = conn.cursor()
-        c.execute("SELECT name, ip FROM nodes WHERE type='edge'")
-        db_edges = {row[0]: {"name": row[0], "ip": row[1], "status": "pending", "cpu": "N/A", "memory": "N/A"} for row in c.fetchall()}
-        conn.close()
+        rows = await run_blocking(db_fetchall, "SELECT name, ip FROM nodes WHERE type='edge'")
+        db_edges = {row[0]: {"name": row[0], "ip": row[1], "status": "pending", "cpu": "N/A", "memory": "N/A"} for row in rows}
 
         # Merge: K8s overrides DB
         merged = {**db_edges, **k8s_nodes_dict}
@@ -538,33 +978,18 @@ async def get_iot_nodes(current_user: User = Depends(get_current_active_user)):
         # Get from K8s if available
         k8s_nodes_dict = {}
         try:
-            nodes = v1.list_node()
-            for node in nodes.items:
+            nodes = await cached_list("nodes")
+            cpu_usage = await run_blocking(get_cluster_cpu_usage, nodes)
+            for node in nodes:
                 node_name = node.metadata.name
-                if "iot" in node_name.lower() or "rpi" in node_name.lower():
-                    status = "offline"
-                    for condition in node.status.conditions:
-                        if condition.type == "Ready":
-                            status = "online" if condition.status == "True" else "offline"
-                            break
-                    # Get REAL CPU usage from Prometheus
-                    cpu_usage = await get_real_cpu_usage(node_name)
-                    k8s_nodes_dict[node_name] = {
-                        "name": node_name,
-                        "ip": get_node_ip(node),
-                        "status": status,
-                        "cpu": cpu_usage,
-                        "memory": get_node_memory(node)
-                    }
+                if node_group(node_name) == "iot":
+                    k8s_nodes_dict[node_name] = {**node_row(node), "cpu": cpu_usage.get(node_name, "0%")}
         except Exception as e:
             logger.warning(f"K8s not available yet: {e}")
 
         # Get from DB
-        conn = sqlite3.connect('nodes.db')
-        c = conn.cursor()
-        c.execute("SELECT name, ip FROM nodes WHERE type='iot'")
-        db_iots = {row[0]: {"name": row[0], "ip": row[1], "status": "pending", "cpu": "N/A", "memory": "N/A"} for row in c.fetchall()}
-        conn.close()
+        rows = await run_blocking(db_fetchall, "SELECT name, ip FROM nodes WHERE type='iot'")
+        db_iots = {row[0]: {"name": row[0], "ip": row[1], "status": "pending", "cpu": "N/A", "memory": "N/A"} for row in rows}
 
         # Merge: K8s overrides DB
         merged = {**db_iots, **k8s_nodes_dict}
@@ -577,10 +1002,10 @@ async def get_iot_nodes(current_user: User = Depends(get_current_active_user)):
 @app.get("/api/nodes")
 async def get_nodes(current_user: User = Depends(get_current_active_user)):
     try:
-        nodes = v1.list_node()
+        nodes = await cached_list("nodes")
         node_data = []
 
-        for node in nodes.items:
+        for node in nodes:
             node_name = node.metadata.name
             labels = node.metadata.labels or {}
             role = labels.get('role', 'unknown')
@@ -627,19 +1052,11 @@ async def get_nodes(current_user: User = Depends(get_current_active_user)):
 @app.get("/api/pods")
 async def get_pods(current_user: User = Depends(get_current_active_user)):
     try:
-        pods = v1.list_pod_for_all_namespaces(watch=False)
+        pods = await cached_list("pods")
         pod_data = []
 
-        for pod in pods.items:
-            pod_data.append({
-                "name": pod.metadata.name,
-                "namespace": pod.metadata.namespace,
-                "node": pod.spec.node_name,
-                "status": pod.status.phase,
-                "ip": pod.status.pod_ip,
-                "created": pod.metadata.creation_timestamp,
-                "labels": pod.metadata.labels or {}
-            })        
+        for pod in pods:
+            pod_data.append(pod_row(pod))
         return {"pods": pod_data}
     except Exception as e:
         logger.error(f"Error getting pods: {e}")
@@ -648,17 +1065,11 @@ async def get_pods(current_user: User = Depends(get_current_active_user)):
 @app.get("/api/deployments")
 async def get_deployments(current_user: User = Depends(get_current_active_user)):
     try:
-        deployments = apps_v1.list_deployment_for_all_namespaces(watch=False)
+        deployments = await cached_list("deployments")
         deployment_data = []
 
-        for deployment in deployments.items:
-            deployment_data.append({
-                "name": deployment.metadata.name,
-                "namespace": deployment.metadata.namespace,
-                "replicas": deployment.status.replicas if deployment.status.replicas else 0,
-                "available": deployment.status.available_replicas if deployment.status.available_replicas else 0,
-                "ready": deployment.status.ready_replicas if deployment.status.ready_replicas else 0
-            })
+        for deployment in deployments:
+            deployment_data.append(deployment_row(deployment))
 
         return {"deployments": deployment_data}
     except Exception as e:
@@ -686,15 +1097,8 @@ async def add_node(data: dict = Body(...), current_user: User = Depends(get_curr
         if not ip_pattern.match(ip):
             raise HTTPException(status_code=400, detail="Invalid IP address format")
 
-        # Store in DB
-        conn = sqlite3.connect('nodes.db')
-        c = conn.cursor()
-        
-        # FIXED: Include is_master column (default to 0 for IoT nodes)
-        c.execute("INSERT OR REPLACE INTO nodes (name, ip, username, password, type, is_master) VALUES (?, ?, ?, ?, ?, ?)", 
-                 (name, ip, username, password, 'iot', 0))
-        conn.commit()
-        conn.close()
+        # Store in DB (IoT nodes are never master)
+        await run_blocking(store_node, name, ip, username, password, 'iot', 0)
 
         logger.info(f"Successfully added pending IoT node {name}")
         return {
@@ -730,28 +1134,8 @@ async def add_edge_node(data: dict = Body(...), current_user: User = Depends(get
         if not ip_pattern.match(ip):
             raise HTTPException(status_code=400, detail="Invalid IP address format")
 
-        # Store in DB
-        conn = sqlite3.connect('nodes.db')
-        c = conn.cursor()
-        
-        # First, update database schema if needed (add is_master column)
-        try:
-            c.execute("SELECT is_master FROM nodes LIMIT 1")
-        except sqlite3.OperationalError:
-            # Column doesn't exist, alter table
-            logger.info("Adding is_master column to nodes table")
-            c.execute("ALTER TABLE nodes ADD COLUMN is_master BOOLEAN DEFAULT 0")
-        
-        # If setting as master, clear existing master
-        if is_master:
-            logger.info(f"Setting {name} as master node - clearing previous master")
-            c.execute("UPDATE nodes SET is_master = 0 WHERE is_master = 1")
-        
         # Store node with master flag
-        c.execute("INSERT OR REPLACE INTO nodes (name, ip, username, password, type, is_master) VALUES (?, ?, ?, ?, ?, ?)", 
-                 (name, ip, username, password, 'edge', is_master))
-        conn.commit()
-        conn.close()
+        await run_blocking(store_node, name, ip, username, password, 'edge', is_master)
 
         message = f"Edge node {name} added as pending. Use 'Deploy to All Nodes' to join cluster."
         if is_master:
@@ -781,39 +1165,31 @@ async def delete_node(node_name: str, current_user: User = Depends(get_current_a
             )
         
         # Get node from DB for SSH details
-        conn = sqlite3.connect('nodes.db')
-        c = conn.cursor()
-        c.execute("SELECT ip, username, password FROM nodes WHERE name=?", (node_name,))
-        node_data = c.fetchone()
-        conn.close()
+        rows = await run_blocking(db_fetchall, "SELECT ip, username, password FROM nodes WHERE name=?", (node_name,))
 
-        if node_data:
-            ip, username, password = node_data
+        if rows:
+            ip, username, password = rows[0]
             # Remove via SSH if joined
-            result = ssh_remove_node(ip, username, password, node_name)
+            result = await run_provisioning(ssh_remove_node, ip, username, password, node_name)
             if not result["success"]:
                 logger.warning(f"Failed to remove node via SSH: {result['error']}")
 
         # Drain and delete from K8s
         try:
             drain_cmd = ["kubectl", "drain", node_name, "--ignore-daemonsets", "--delete-emptydir-data", "--force"]
-            drain_result = subprocess.run(drain_cmd, capture_output=True, text=True)
+            drain_result = await run_provisioning(subprocess.run, drain_cmd, capture_output=True, text=True)
             if drain_result.returncode != 0:
                 logger.warning(f"Failed to drain node {node_name}: {drain_result.stderr}")
 
             delete_cmd = ["kubectl", "delete", "node", node_name]
-            delete_result = subprocess.run(delete_cmd, capture_output=True, text=True)
+            delete_result = await run_provisioning(subprocess.run, delete_cmd, capture_output=True, text=True)
             if delete_result.returncode != 0:
                 logger.warning(f"Failed to delete node {node_name}: {delete_result.stderr}")
         except Exception as e:
             logger.warning(f"K8s node deletion failed: {e}")
 
         # Remove from DB
-        conn = sqlite3.connect('nodes.db')
-        c = conn.cursor()
-        c.execute("DELETE FROM nodes WHERE name=?", (node_name,))
-        conn.commit()
-        conn.close()
+        await run_blocking(db_execute, "DELETE FROM nodes WHERE name=?", (node_name,))
 
         return {"message": f"Node {node_name} removed successfully", "success": True}
 
@@ -827,6 +1203,7 @@ async def delete_node(node_name: str, current_user: User = Depends(get_current_a
 @app.post("/api/deploy/all")
 async def deploy_all(current_user: User = Depends(get_current_active_user)):
     """Automated deployment: Install on master, join nodes, deploy apps"""
+    global v1, apps_v1
     try:
         # Send initial progress
         await progress_manager.send_progress({
@@ -839,9 +1216,8 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
         # SMART CHECK: See what's already deployed
         existing_nodes = []
         try:
-            config.load_kube_config(config_file="/home/nuc2/.kube/config")
-            v1 = client.CoreV1Api()
-            existing_nodes = [node.metadata.name for node in v1.list_node().items]
+            await run_blocking(load_kube_clients, "/home/nuc2/.kube/config")
+            existing_nodes = [node.metadata.name for node in (await run_blocking(v1.list_node)).items]
             await progress_manager.send_progress({
                 "type": "progress",
                 "percent": 15,
@@ -862,11 +1238,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
         validate_deployment_files()  
 
         # Check if nodes exist in database
-        conn = sqlite3.connect('nodes.db')
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) FROM nodes")
-        node_count = c.fetchone()[0]
-        conn.close()
+        node_count = (await run_blocking(db_fetchall, "SELECT COUNT(*) FROM nodes"))[0][0]
         
         if node_count == 0:
             await progress_manager.send_progress({
@@ -893,7 +1265,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
             "message": "Identifying master node..."
         })
         # Get master node dynamically from database
-        master_node = get_master_node()
+        master_node = await run_blocking(get_master_node)
         if not master_node:
             await progress_manager.send_progress({
                 "type": "error",
@@ -921,8 +1293,8 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
         # SMART CHECK: Skip master setup if already running
         k3s_running = False
         try:
-            result = subprocess.run(["sudo", "systemctl", "is-active", "k3s"], 
-                                  capture_output=True, text=True)
+            result = await run_provisioning(subprocess.run, ["sudo", "systemctl", "is-active", "k3s"],
+                                            capture_output=True, text=True)
             k3s_running = result.returncode == 0
         except:
             pass
@@ -937,9 +1309,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
             
             # Just ensure kubeconfig is loaded
             try:
-                config.load_kube_config(config_file="/home/nuc2/.kube/config")
-                v1 = client.CoreV1Api()
-                apps_v1 = client.AppsV1Api()
+                await run_blocking(load_kube_clients, "/home/nuc2/.kube/config")
             except Exception as e:
                 logger.error(f"Failed to load kubeconfig: {e}")
                 raise HTTPException(status_code=500, detail=f"Failed to load kubeconfig: {e}")
@@ -962,7 +1332,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
                 "message": "Installing k3s on master node..."
             })
             logger.info("Installing k3s using custom script...")
-            result = subprocess.run([install_script_path], shell=True, capture_output=True, text=True)
+            result = await run_provisioning(subprocess.run, [install_script_path], shell=True, capture_output=True, text=True)
             if result.returncode != 0:
                 await progress_manager.send_progress({
                     "type": "error",
@@ -986,7 +1356,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
                 "message": "Waiting for k3s to be ready..."
             })
             logger.info("Waiting for k3s to be ready...")
-            time.sleep(30)
+            await asyncio.sleep(30)
 
             # Now load kubeconfig
             try:
@@ -995,9 +1365,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
                     "percent": 60,
                     "message": "Loading Kubernetes configuration..."
                 })
-                config.load_kube_config(config_file="/home/nuc2/.kube/config")
-                v1 = client.CoreV1Api()
-                apps_v1 = client.AppsV1Api()
+                await run_blocking(load_kube_clients, "/home/nuc2/.kube/config")
                 await progress_manager.send_progress({
                     "type": "progress",
                     "percent": 65,
@@ -1036,7 +1404,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
                     "message": f"Installing component {i+1}/{len(other_components)}..."
                 })
                 logger.info(f"Running: {cmd[:50]}...")
-                result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+                result = await run_provisioning(subprocess.run, cmd, shell=True, capture_output=True, text=True)
                 if result.returncode != 0:
                     logger.warning(f"Command failed but continuing: {cmd}. Error: {result.stderr}")
 
@@ -1063,7 +1431,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
                     "message": f"Configuring Grafana {j+1}/{len(grafana_setup_commands)}..."
                 })
                 logger.info(f"Running Grafana setup: {cmd[:80]}...")
-                result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=120)
+                result = await run_provisioning(subprocess.run, cmd, shell=True, capture_output=True, text=True, timeout=120)
                 if result.returncode != 0:
                     logger.warning(f"Grafana setup command failed: {cmd}. Error: {result.stderr}")
                 else:
@@ -1083,7 +1451,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
                 src = os.path.join(FILES_DIR, file)
                 if os.path.exists(src):
                     try:
-                        shutil.copy(src, target_dir)
+                        await run_blocking(shutil.copy, src, target_dir)
                         logger.info(f"Copied {file} to master")
                     except Exception as e:
                         logger.warning(f"Failed to copy {file}: {e}")
@@ -1108,8 +1476,8 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
             logger.error(f"Failed to get token from /home/nuc2/node-token: {e}")
             # Fallback to system location
             try:
-                result = subprocess.run(["sudo", "cat", "/var/lib/rancher/k3s/server/node-token"], 
-                                      capture_output=True, text=True)
+                result = await run_provisioning(subprocess.run, ["sudo", "cat", "/var/lib/rancher/k3s/server/node-token"],
+                                                capture_output=True, text=True)
                 if result.returncode == 0:
                     token = result.stdout.strip()
                     logger.info("Retrieved k3s token via subprocess")
@@ -1125,14 +1493,12 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
             raise HTTPException(status_code=500, detail="Failed to get k3s join token")
 
         # Get all worker nodes from database
-        conn = sqlite3.connect('nodes.db')
-        c = conn.cursor()
-        c.execute("SELECT name, ip, username, password, type FROM nodes WHERE name != ?", (MASTER_NAME,))
-        all_nodes = c.fetchall()
-        conn.close()
+        all_nodes = await run_blocking(db_fetchall, "SELECT name, ip, username, password, type FROM nodes WHERE name != ?", (MASTER_NAME,))
 
         # Filter out nodes that are already in cluster
         nodes_to_join = []
+        joined_nodes = []
+        failed_nodes = []
         for node in all_nodes:
             name, ip, username, password, node_type = node
             if name not in existing_nodes:
@@ -1166,51 +1532,24 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
             })
             logger.info(f"Joining {len(nodes_to_join)} new nodes to cluster...")
             
-            for i, (name, ip, username, password, node_type) in enumerate(nodes_to_join):
-                progress = 87 + int((i / len(nodes_to_join)) * 8)
-                await progress_manager.send_progress({
-                    "type": "progress",
-                    "percent": progress,
-                    "message": f"Setting up {name} ({ip}) as {node_type}"
-                })
-                logger.info(f"Setting up node: {name} ({ip}) as {node_type}")
-                
-                try:
-                    ssh = ssh_connect_with_retry(ip, username, password)
-                    if not ssh:
-                        raise Exception(f"Failed to connect to {name}")
-
-                    # Install prerequisites based on node type
-                    prereq_cmds = get_installation_commands(node_type)
-                    logger.info(f"Installing prerequisites on {name}...")
-                    
-                    for j, cmd in enumerate(prereq_cmds):
-                        logger.info(f"  Prereq [{j+1}/{len(prereq_cmds)}]: {cmd[:50]}...")
-                        exit_status, output, error = ssh_execute_with_retry(ssh, cmd)
-                        if exit_status != 0:
-                            logger.warning(f"Prereq command failed on {name}: {cmd}. Error: {error}")
-
-                    # Join node to cluster
-                    role = 'edge' if node_type == 'edge' else 'iot'
-                    logger.info(f"Joining {name} as {role} node...")
-                    result = ssh_join_node_generic(ip, username, password, MASTER_IP, token, name, role)
-                    
-                    if not result["success"]:
-                        logger.error(f"Failed to join {name}: {result['error']}")
-                        # Continue with other nodes even if one fails
-                        continue
-
-                    ssh.close()
-                    await progress_manager.send_progress({
-                        "type": "progress",
-                        "percent": progress + 2,
-                        "message": f"Successfully joined {name} to cluster"
-                    })
-                    logger.info(f"Successfully joined {name} to cluster")
-
-                except Exception as e:
-                    logger.error(f"Failed to setup node {name}: {str(e)}")
-                    # Continue with other nodes
+            semaphore = asyncio.Semaphore(JOIN_CONCURRENCY)
+            join_progress = JoinProgress(sum(join_steps(node[4]) for node in nodes_to_join))
+            results = await asyncio.gather(*(
+                provision_worker(name, ip, username, password, node_type, token, semaphore, join_progress)
+                for name, ip, username, password, node_type in nodes_to_join
+            ))
+            joined_nodes = [result["name"] for result in results if result["success"]]
+            failed_nodes = [result["name"] for result in results if not result["success"]]
+
+            message = f"Joined {len(joined_nodes)} of {len(nodes_to_join)} new nodes"
+            if failed_nodes:
+                message += f", failed: {', '.join(failed_nodes)}"
+            await progress_manager.send_progress({
+                "type": "progress",
+                "percent": 95,
+                "message": message
+            })
+            logger.info(message)
 
         # ========== UPDATED SECTION: ConfigMap Creation and Manifest Application ==========
         
@@ -1226,7 +1565,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
         detect_py_path = os.path.join(FILES_DIR, 'detect.py')
         if os.path.exists(detect_py_path):
             logger.info("Creating myapp-config ConfigMap...")
-            result = subprocess.run([
+            result = await run_provisioning(subprocess.run, [
                 "kubectl", "create", "configmap", "myapp-config",
                 "--from-file", f"detect.py={detect_py_path}",
                 "--dry-run=client", "-o", "yaml"
@@ -1234,7 +1573,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
             
             if result.returncode == 0:
                 # Apply the ConfigMap
-                apply_result = subprocess.run([
+                apply_result = await run_provisioning(subprocess.run, [
                     "kubectl", "apply", "-f", "-"
                 ], input=result.stdout, capture_output=True, text=True)
                 
@@ -1275,14 +1614,14 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
                 # Special handling for myapp.yaml to ensure clean deployment
                 if yaml_file == 'myapp.yaml':
                     # Delete existing StatefulSet to ensure fresh deployment with new image
-                    delete_result = subprocess.run([
+                    delete_result = await run_provisioning(subprocess.run, [
                         "kubectl", "delete", "statefulset", "myapp", "--ignore-not-found=true"
                     ], capture_output=True, text=True)
                     if delete_result.returncode == 0:
                         logger.info("Deleted existing myapp StatefulSet for fresh deployment")
-                    time.sleep(2)  # Brief pause
+                    await asyncio.sleep(2)  # Brief pause
                 
-                result = subprocess.run(["kubectl", "apply", "-f", path], capture_output=True, text=True)
+                result = await run_provisioning(subprocess.run, ["kubectl", "apply", "-f", path], capture_output=True, text=True)
                 if result.returncode != 0:
                     logger.error(f"Failed to apply {yaml_file}: {result.stderr}")
                 else:
@@ -1308,17 +1647,14 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
         
         try:
             # Check nodes
-            nodes = v1.list_node()
+            nodes = await run_blocking(v1.list_node)
             node_count = len(nodes.items) if hasattr(nodes, 'items') else 0
             
             # Get current worker nodes from database
-            conn = sqlite3.connect('nodes.db')
-            c = conn.cursor()
-            c.execute("SELECT name FROM nodes WHERE name != ?", (MASTER_NAME,))
-            worker_nodes = [row[0] for row in c.fetchall()]
-            conn.close()
+            rows = await run_blocking(db_fetchall, "SELECT name FROM nodes WHERE name != ?", (MASTER_NAME,))
+            worker_nodes = [row[0] for row in rows]
             
-            worker_nodes_joined = len([n for n in worker_nodes if n in existing_nodes + [node[0] for node in nodes_to_join]])
+            worker_nodes_joined = len([n for n in worker_nodes if n in existing_nodes + joined_nodes])
             
             await progress_manager.send_progress({
                 "type": "progress",
@@ -1329,7 +1665,7 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
             logger.info(f"Cluster now has {node_count} nodes")
 
             # Check pods
-            pods = v1.list_namespaced_pod(namespace="default")
+            pods = await run_blocking(v1.list_namespaced_pod, namespace="default")
             running_pods = [p for p in pods.items if p.status.phase == "Running"] if hasattr(pods, 'items') else []
             
             # FIXED: Add active_step to completion message
@@ -1342,7 +1678,8 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
                 "details": {
                     "master_setup": "completed",
                     "worker_nodes_joined": worker_nodes_joined,
-                    "new_nodes_added": len(nodes_to_join),
+                    "new_nodes_added": len(joined_nodes),
+                    "failed_nodes": failed_nodes,
                     "manifests_applied": len([f for f in yaml_files if os.path.exists(os.path.join(FILES_DIR, f))]),
                     "configmaps_created": 1
                 }
@@ -1366,7 +1703,8 @@ async def deploy_all(current_user: User = Depends(get_current_active_user)):
             "details": {
                 "master_setup": "completed",
                 "worker_nodes_joined": worker_nodes_joined,
-                "new_nodes_added": len(nodes_to_join),
+                "new_nodes_added": len(joined_nodes),
+                "failed_nodes": failed_nodes,
                 "manifests_applied": len([f for f in yaml_files if os.path.exists(os.path.join(FILES_DIR, f))]),
                 "configmaps_created": 1
             }
@@ -4,8 +4,6 @@ $(document).ready(function () {
     const API_BASE = `${API_BASE_URL}/api`;
     let edgeNodesData = [];
     let iotNodesData = [];
-    let refreshInterval = 30000; // 30 seconds
-    let refreshTimer = null;
     let sessionWarningTimer = null;
     let tokenRefreshTimer = null;
 
@@ -96,6 +94,9 @@ $(document).ready(function () {
                         addLog('📊 Master setup: ' + data.details.master_setup);
                         addLog('📊 Worker nodes joined: ' + data.details.worker_nodes_joined);
                         addLog('📊 New nodes added: ' + data.details.new_nodes_added);
+                        if (data.details.failed_nodes && data.details.failed_nodes.length) {
+                            addLog('⚠️ Nodes failed to join: ' + data.details.failed_nodes.join(', '));
+                        }
                         addLog('📊 Manifests applied: ' + data.details.manifests_applied);
                     }
 
@@ -128,6 +129,94 @@ $(document).ready(function () {
     // Initialize WebSocket when page loads
     connectProgressWebSocket();
 
+    // =========================
+    // LIVE CLUSTER UPDATES
+    // =========================
+    // The backend pushes node and CPU changes over /ws/cluster, so the pages
+    // are patched in place instead of re-polling the REST endpoints.
+    let clusterWebSocket = null;
+    let clusterReconnectTimer = null;
+    let clusterConnectedBefore = false;
+
+    function connectClusterWebSocket() {
+        const token = localStorage.getItem("token");
+        if (!token || (clusterWebSocket && clusterWebSocket.readyState <= WebSocket.OPEN)) return;
+
+        const wsUrl = `${API_BASE_URL.replace(/^http/, 'ws')}/ws/cluster?token=${encodeURIComponent(token)}`;
+        clusterWebSocket = new WebSocket(wsUrl);
+
+        clusterWebSocket.onopen = function () {
+            console.log('✅ Cluster WebSocket connected');
+            clusterWebSocket.send(JSON.stringify({ subscribe: ['nodes', 'metrics'] }));
+            // Pending (not yet joined) nodes only come from the REST listings
+            if (clusterConnectedBefore) {
+                loadDashboardStats();
+                loadIoTNodes();
+                loadEdgeNodes();
+            }
+            clusterConnectedBefore = true;
+        };
+
+        clusterWebSocket.onmessage = function (event) {
+            try {
+                handleClusterUpdate(JSON.parse(event.data));
+            } catch (error) {
+                console.error('❌ Failed to handle cluster update:', error);
+            }
+        };
+
+        clusterWebSocket.onclose = function (event) {
+            console.log('🔌 Cluster WebSocket disconnected:', event.code, event.reason);
+            clusterWebSocket = null;
+            // 1008: token rejected, wait for the next login
+            if (event.code !== 1008 && localStorage.getItem("token")) {
+                clusterReconnectTimer = setTimeout(connectClusterWebSocket, 3000);
+            }
+        };
+    }
+
+    function disconnectClusterWebSocket() {
+        if (clusterReconnectTimer) clearTimeout(clusterReconnectTimer);
+        if (clusterWebSocket) clusterWebSocket.close();
+    }
+
+    function findNode(name) {
+        return edgeNodesData.find(node => node.name === name) ||
+            iotNodesData.find(node => node.name === name);
+    }
+
+    function handleClusterUpdate(message) {
+        if (message.type !== 'snapshot' && message.type !== 'delta') return;
+
+        Object.entries(message.data).forEach(([name, row]) => {
+            if (message.topic === 'nodes') {
+                const nodes = row && row.group === 'iot' ? iotNodesData : edgeNodesData;
+                const existing = findNode(name);
+                if (!row) {
+                    edgeNodesData = edgeNodesData.filter(node => node.name !== name);
+                    iotNodesData = iotNodesData.filter(node => node.name !== name);
+                } else if (!row.group) {
+                    return;
+                } else if (existing) {
+                    Object.assign(existing, row, { cpu: existing.cpu === 'N/A' ? '0%' : existing.cpu });
+                } else {
+                    nodes.push({ ...row, cpu: '0%' });
+                }
+            } else if (message.topic === 'metrics' && row) {
+                const node = findNode(name);
+                if (node) node.cpu = row.cpu;
+            }
+        });
+
+        renderDashboardStats();
+        const activeSection = $('.page-section.active').attr('id');
+        if (activeSection === 'edge-nodes') {
+            renderEdgeNodes();
+        } else if (activeSection === 'iot-nodes') {
+            renderIoTNodes();
+        }
+    }
+
     // =========================
     // Authentication
     // =========================
@@ -156,7 +245,7 @@ $(document).ready(function () {
                 startSessionWarning();
 
                 loadDashboardStats();
-                startAutoRefresh();
+                connectClusterWebSocket();
 
                 // Load IoT nodes if needed
                 loadIoTNodes();
@@ -173,7 +262,7 @@ $(document).ready(function () {
             // Clear all timers
             if (tokenRefreshTimer) clearInterval(tokenRefreshTimer);
             if (sessionWarningTimer) clearTimeout(sessionWarningTimer);
-            if (refreshTimer) clearInterval(refreshTimer);
+            disconnectClusterWebSocket();
 
             localStorage.removeItem("token");
             $('#session-warning').empty();
@@ -297,27 +386,11 @@ $(document).ready(function () {
         window.scrollTo(0, 0);
     });
 
-    // =========================
-    // Auto Refresh Function
-    // =========================
-    function startAutoRefresh() {
-        if (refreshTimer) clearInterval(refreshTimer);
-        refreshTimer = setInterval(() => {
-            const activeSection = $('.page-section.active').attr('id');
-            if (activeSection === 'dashboard') {
-                loadDashboardStats();
-            } else if (activeSection === 'edge-nodes') {
-                loadEdgeNodes();
-            } else if (activeSection === 'iot-nodes') {
-                loadIoTNodes();
-            }
-        }, refreshInterval);
-    }
-
     // =========================
     // Dashboard Stats
     // =========================
     loadDashboardStats();
+    connectClusterWebSocket();
 
     function loadDashboardStats() {
         $('.stats-number').html('<div class="loading-spinner mx-auto" style="width: 20px; height: 20px;"></div>');
@@ -342,26 +415,7 @@ $(document).ready(function () {
                     headers: { "Authorization": "Bearer " + token },
                     success: function (iotData) {
                         iotNodesData = iotData;
-
-                        $('#total-nodes').text(edgeData.length + iotData.length);
-                        $('#edge-nodes-count').text(edgeData.length);
-                        $('#iot-nodes-count').text(iotData.length);
-
-                        let totalCpu = 0;
-                        let nodeCount = 0;
-
-                        edgeData.forEach(node => {
-                            totalCpu += parseFloat(node.cpu.replace('%', '')) || 0;
-                            nodeCount++;
-                        });
-
-                        iotData.forEach(node => {
-                            totalCpu += parseFloat(node.cpu.replace('%', '')) || 0;
-                            nodeCount++;
-                        });
-
-                        const avgCpu = nodeCount > 0 ? (totalCpu / nodeCount).toFixed(1) : 0;
-                        $('#avg-cpu').text(`${avgCpu}%`);
+                        renderDashboardStats();
                     },
                     error: function (xhr, status, error) {
                         if (xhr.status === 401) {
@@ -384,6 +438,23 @@ $(document).ready(function () {
         });
     }
 
+    function renderDashboardStats() {
+        $('#total-nodes').text(edgeNodesData.length + iotNodesData.length);
+        $('#edge-nodes-count').text(edgeNodesData.length);
+        $('#iot-nodes-count').text(iotNodesData.length);
+
+        let totalCpu = 0;
+        let nodeCount = 0;
+
+        edgeNodesData.concat(iotNodesData).forEach(node => {
+            totalCpu += parseFloat((node.cpu || '').replace('%', '')) || 0;
+            nodeCount++;
+        });
+
+        const avgCpu = nodeCount > 0 ? (totalCpu / nodeCount).toFixed(1) : 0;
+        $('#avg-cpu').text(`${avgCpu}%`);
+    }
+
     // =========================
     // Edge Nodes
     // =========================
@@ -484,39 +555,7 @@ $(document).ready(function () {
             headers: { "Authorization": "Bearer " + token },
             success: function (data) {
                 edgeNodesData = data;
-                tbody.empty();
-
-                if (data.length === 0) {
-                    tbody.html('<tr><td colspan="6" class="text-center py-4">No edge nodes found</td></tr>');
-                    return;
-                }
-
-                data.forEach(node => {
-                    const statusClass = node.status === 'online' ? 'status-online' :
-                        (node.status === 'warning' ? 'status-warning' : 'status-offline');
-
-                    const isMasterNode = node.name.toLowerCase().includes('nuc2') ||
-                        node.name.toLowerCase().includes('master') ||
-                        node.name.toLowerCase().includes('control-plane');
-
-                    const deleteButton = isMasterNode
-                        ? '<button class="btn btn-sm btn-danger action-btn" disabled title="Cannot delete master node"><i class="fas fa-lock me-1"></i> Protected</button>'
-                        : `<button class="btn btn-sm btn-danger action-btn delete-edge-btn" data-node="${node.name}">Delete</button>`;
-
-                    tbody.append(`
-                    <tr>
-                        <td>${node.name}</td>
-                        <td>${node.ip}</td>
-                        <td><span class="status-indicator ${statusClass}"></span> ${node.status}</td>
-                        <td>${node.cpu}</td>
-                        <td>${node.memory}</td>
-                        <td>
-                            <button class="btn btn-sm btn-info action-btn">View</button>
-                            ${deleteButton}
-                        </td>
-                    </tr>
-                `);
-                });
+                renderEdgeNodes();
             },
             error: function (xhr, status, error) {
                 if (xhr.status === 401) {
@@ -529,6 +568,43 @@ $(document).ready(function () {
         });
     }
 
+    function renderEdgeNodes() {
+        const tbody = $('#edge-nodes table tbody');
+        tbody.empty();
+
+        if (edgeNodesData.length === 0) {
+            tbody.html('<tr><td colspan="6" class="text-center py-4">No edge nodes found</td></tr>');
+            return;
+        }
+
+        edgeNodesData.forEach(node => {
+            const statusClass = node.status === 'online' ? 'status-online' :
+                (node.status === 'warning' ? 'status-warning' : 'status-offline');
+
+            const isMasterNode = node.name.toLowerCase().includes('nuc2') ||
+                node.name.toLowerCase().includes('master') ||
+                node.name.toLowerCase().includes('control-plane');
+
+            const deleteButton = isMasterNode
+                ? '<button class="btn btn-sm btn-danger action-btn" disabled title="Cannot delete master node"><i class="fas fa-lock me-1"></i> Protected</button>'
+                : `<button class="btn btn-sm btn-danger action-btn delete-edge-btn" data-node="${node.name}">Delete</button>`;
+
+            tbody.append(`
+            <tr>
+                <td>${node.name}</td>
+                <td>${node.ip}</td>
+                <td><span class="status-indicator ${statusClass}"></span> ${node.status}</td>
+                <td>${node.cpu}</td>
+                <td>${node.memory}</td>
+                <td>
+                    <button class="btn btn-sm btn-info action-btn">View</button>
+                    ${deleteButton}
+                </td>
+            </tr>
+        `);
+        });
+    }
+
     // =========================
     // IoT Nodes
     // =========================
@@ -621,31 +697,8 @@ $(document).ready(function () {
             method: "GET",
             headers: { "Authorization": "Bearer " + token },
             success: function (data) {
-                tbody.empty();
-
-                if (data.length === 0) {
-                    tbody.html('<tr><td colspan="6" class="text-center py-4">No IoT nodes found</td></tr>');
-                    return;
-                }
-
-                data.forEach(node => {
-                    const statusClass = node.status === 'online' ? 'status-online' :
-                        (node.status === 'warning' ? 'status-warning' : 'status-offline');
-
-                    tbody.append(`
-                    <tr>
-                        <td>${node.name}</td>
-                        <td>${node.ip || node.ip_address}</td>
-                        <td><span class="status-indicator ${statusClass}"></span> ${node.status}</td>
-                        <td>${node.cpu || '-'}</td>
-                        <td>${node.memory || '-'}</td>
-                        <td>
-                            <button class="btn btn-sm btn-info action-btn">View</button>
-                            <button class="btn btn-sm btn-danger action-btn delete-iot-btn" data-node="${node.name}">Delete</button>
-                        </td>
-                    </tr>
-                `);
-                });
+                iotNodesData = data;
+                renderIoTNodes();
             },
             error: function (xhr, status, error) {
                 if (xhr.status === 401) {
@@ -658,6 +711,35 @@ $(document).ready(function () {
         });
     }
 
+    function renderIoTNodes() {
+        const tbody = $('#iot-nodes table tbody');
+        tbody.empty();
+
+        if (iotNodesData.length === 0) {
+            tbody.html('<tr><td colspan="6" class="text-center py-4">No IoT nodes found</td></tr>');
+            return;
+        }
+
+        iotNodesData.forEach(node => {
+            const statusClass = node.status === 'online' ? 'status-online' :
+                (node.status === 'warning' ? 'status-warning' : 'status-offline');
+
+            tbody.append(`
+            <tr>
+                <td>${node.name}</td>
+                <td>${node.ip || node.ip_address}</td>
+                <td><span class="status-indicator ${statusClass}"></span> ${node.status}</td>
+                <td>${node.cpu || '-'}</td>
+                <td>${node.memory || '-'}</td>
+                <td>
+                    <button class="btn btn-sm btn-info action-btn">View</button>
+                    <button class="btn btn-sm btn-danger action-btn delete-iot-btn" data-node="${node.name}">Delete</button>
+                </td>
+            </tr>
+        `);
+        });
+    }
+
     // =========================
     // Delete Node Functions
     // =========================
@@ -930,6 +1012,7 @@ $(document).ready(function () {
     function handleUnauthorizedError() {
         alert('Session expired. Please login again.');
         localStorage.removeItem("token");
+        disconnectClusterWebSocket();
         $('#loginModal').modal('show');
 
         $('.stats-number').text('Please login');
@@ -0,0 +1,336 @@
+"""Offline benchmark for the detect.py pipeline.
+
+Feeds the same capture/preprocess/inference/output stages as detect.py from
+a local video file or synthetic frames, without Coral hardware or a camera,
+and reports per-stage timings, throughput and memory at every combination
+of the requested resolutions, --top_k and --threshold values.
+
+Deterministic stub interpreter (no model needed):
+python3 benchmark.py --resolutions 640x480,1280x720 --top_k 3,10 --threshold 0.1,0.5
+
+CPU TFLite interpreter on a recorded clip:
+python3 benchmark.py --interpreter cpu \
+  --model ../all_models/mobilenet_ssd_v2_coco_quant_postprocess.tflite \
+  --video recording.mp4 --json results.json
+
+"""
+import argparse
+import collections
+import cv2
+import itertools
+import json
+import numpy as np
+import os
+import threading
+import time
+
+import detect
+
+
+class BBox(collections.namedtuple('BBox', ['xmin', 'ymin', 'xmax', 'ymax'])):
+    """Mirrors the parts of pycoral's BBox the output stage uses."""
+
+    def scale(self, sx, sy):
+        return BBox(self.xmin * sx, self.ymin * sy, self.xmax * sx, self.ymax * sy)
+
+
+Object = collections.namedtuple('Object', ['id', 'score', 'bbox'])
+
+
+class StubInterpreter:
+    """Stands in for an Edge TPU interpreter with a fixed latency.
+
+    Always "detects" the same `num_objects` boxes, with scores spread
+    evenly over (0, 1], so --threshold and --top_k act like on a real model.
+    """
+
+    def __init__(self, size=(300, 300), latency=0.01, num_objects=20, seed=0):
+        self.size = size
+        self.latency = latency
+        rng = np.random.RandomState(seed)
+        width, height = size
+        self.objects = []
+        for i in range(num_objects):
+            x0, y0 = rng.randint(0, width // 2), rng.randint(0, height // 2)
+            x1, y1 = x0 + rng.randint(10, width // 2), y0 + rng.randint(10, height // 2)
+            score = 1.0 - i / num_objects
+            self.objects.append(Object(i % 80, score, BBox(x0, y0, x1, y1)))
+
+    def invoke(self, interpreter, rgb):
+        time.sleep(self.latency)
+
+    def decode(self, interpreter, threshold):
+        return [obj for obj in self.objects if obj.score >= threshold]
+
+
+class CpuInterpreter:
+    """Runs a quantized (non-Edge TPU) SSD model with the CPU TFLite runtime."""
+
+    def __init__(self, model_path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self.interpreter = Interpreter(model_path=model_path)
+        self.interpreter.allocate_tensors()
+        details = self.interpreter.get_input_details()[0]
+        if details['dtype'] != np.uint8:
+            raise ValueError('only uint8 quantized models are supported')
+        _, height, width, _ = details['shape']
+        self.size = (int(width), int(height))
+        self._input = details['index']
+
+    def invoke(self, interpreter, rgb):
+        self.interpreter.set_tensor(self._input, rgb[np.newaxis])
+        self.interpreter.invoke()
+
+    def decode(self, interpreter, threshold):
+        if detect.get_objects:
+            return detect.get_objects(self.interpreter, threshold)
+        # TFLite_Detection_PostProcess: boxes, classes, scores, count.
+        outputs = [self.interpreter.get_tensor(d['index'])
+                   for d in self.interpreter.get_output_details()]
+        boxes, classes, scores, count = (np.squeeze(o) for o in outputs)
+        width, height = self.size
+        return [Object(int(classes[i]), float(scores[i]),
+                       BBox(boxes[i][1] * width, boxes[i][0] * height,
+                            boxes[i][3] * width, boxes[i][2] * height))
+                for i in range(int(count)) if scores[i] >= threshold]
+
+
+class ReplayCapture:
+    """cv2.VideoCapture look-alike that replays preloaded frames.
+
+    Frames are served round-robin until `count` have been read, optionally
+    paced to `fps` to mimic a live camera (0 serves them as fast as asked).
+    """
+
+    def __init__(self, frames, count, fps=0):
+        self.frames = frames
+        self.count = count
+        self.interval = 1.0 / fps if fps else 0
+        self._read = 0
+        self._next_time = time.monotonic()
+
+    def isOpened(self):
+        return self._read < self.count
+
+    def read(self):
+        if self._read >= self.count:
+            return False, None
+        if self.interval:
+            delay = self._next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_time = max(self._next_time, time.monotonic()) + self.interval
+        frame = self.frames[self._read % len(self.frames)]
+        self._read += 1
+        return True, frame.copy()
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        pass
+
+
+def load_frames(video, resolution, clip_frames):
+    """Decodes up to `clip_frames` frames at `resolution`, or synthesizes them."""
+    width, height = resolution
+    frames = []
+    if video:
+        cap = cv2.VideoCapture(video)
+        while len(frames) < clip_frames:
+            ret, image = cap.read()
+            if not ret:
+                break
+            frames.append(cv2.resize(image, resolution))
+        cap.release()
+        if not frames:
+            raise ValueError('could not read frames from {}'.format(video))
+        return frames
+    rng = np.random.RandomState(0)
+    background = rng.randint(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(clip_frames):
+        image = background.copy()
+        x = (i * width // clip_frames) % width
+        cv2.rectangle(image, (x, height // 4), (x + width // 8, height // 2), (0, 255, 0), -1)
+        frames.append(image)
+    return frames
+
+
+class StageTimings:
+    """Collects the stage durations detect.py reports through `observe`."""
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+
+    def observe(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def summary(self):
+        result = {}
+        for stage, values in self.samples.items():
+            values = np.asarray(values) * 1000
+            result[stage] = {
+                'mean_ms': round(float(values.mean()), 3),
+                'p50_ms': round(float(np.percentile(values, 50)), 3),
+                'p95_ms': round(float(np.percentile(values, 95)), 3),
+            }
+        return result
+
+
+class RssSampler(threading.Thread):
+    """Tracks the peak resident set size while one configuration runs.
+
+    ru_maxrss is the peak over the whole process, so every configuration
+    after the largest one would report the same value. This samples the
+    current RSS from /proc/self/statm instead.
+    """
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self.stop_event = threading.Event()
+        self.peak = self.current()
+
+    def current(self):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * self.page_size
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.peak = max(self.peak, self.current())
+        return self.peak
+
+
+def run_once(frames, interpreter, args, threshold, top_k):
+    """Pushes `args.frames` frames through the pipeline and measures it."""
+    timings = StageTimings()
+    stop_event = threading.Event()
+    caps = [ReplayCapture(frames, args.frames, args.fps) for _ in range(args.streams)]
+    gate = None
+    if args.infer_every > 1 or args.motion_threshold:
+        gate = detect.MotionGate(args.infer_every, args.motion_threshold, args.max_skip)
+    stages, capture_qs, result_q = detect.build_pipeline(
+        caps, [interpreter], interpreter.size, threshold, top_k, args.queue_size,
+        args.latest_frame, stop_event, timings,
+        invoke=interpreter.invoke, decode=interpreter.decode, gate=gate,
+        tracker=detect.IouTracker() if args.track else None)
+    writer = detect.DetectionWriter(os.devnull, 'json', {}, interpreter.size, 0)
+
+    rss = RssSampler()
+    rss.start()
+    start = time.monotonic()
+    for stage in stages:
+        stage.start()
+    done = ages = skipped = 0
+    while True:
+        frame = detect._get(result_q, stop_event)
+        if frame is detect._STOP:
+            break
+        render_start = time.monotonic()
+        writer.write(frame)
+        timings.observe('render', time.monotonic() - render_start)
+        ages += time.monotonic() - frame.timestamp
+        skipped += frame.skipped
+        done += 1
+    elapsed = time.monotonic() - start
+    stop_event.set()
+    for stage in stages:
+        stage.join(timeout=1.0)
+    writer.close()
+    peak_rss = rss.stop()
+    failed = [stage.name for stage in stages if stage.failed]
+    if failed:
+        raise RuntimeError('pipeline stage {} failed'.format(', '.join(failed)))
+
+    return {
+        'frames': done,
+        'dropped': sum(getattr(q, 'dropped', 0) for q in capture_qs),
+        'skipped': skipped,
+        'fps': round(done / elapsed, 2),
+        'frame_age_ms': round(1000 * ages / done, 3) if done else None,
+        'peak_rss_mb': round(peak_rss / 2 ** 20, 1),
+        'stages': timings.summary(),
+    }
+
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interpreter', choices=('stub', 'cpu'), default='stub',
+                        help='deterministic stub or CPU TFLite interpreter')
+    parser.add_argument('--model', help='.tflite model path for --interpreter cpu')
+    parser.add_argument('--stub_latency_ms', type=float, default=10.0,
+                        help='simulated inference time of the stub interpreter')
+    parser.add_argument('--video', help='video file to replay, synthetic frames if unset')
+    parser.add_argument('--resolutions', default='640x480',
+                        help='comma-separated WxH source resolutions to sweep')
+    parser.add_argument('--top_k', default='3',
+                        help='comma-separated --top_k values to sweep')
+    parser.add_argument('--threshold', default='0.1',
+                        help='comma-separated --threshold values to sweep')
+    parser.add_argument('--frames', type=int, default=300,
+                        help='frames pushed through the pipeline per run and stream')
+    parser.add_argument('--clip_frames', type=int, default=30,
+                        help='distinct frames kept in memory and replayed in a loop')
+    parser.add_argument('--fps', type=float, default=0,
+                        help='pace capture like a live camera, 0 for as fast as possible')
+    parser.add_argument('--streams', type=int, default=1,
+                        help='number of replayed streams sharing the interpreter')
+    parser.add_argument('--queue_size', type=int, default=2,
+                        help='max frames buffered between pipeline stages')
+    parser.add_argument('--latest_frame', action='store_true',
+                        help='benchmark the latest-frame-wins capture mode')
+    parser.add_argument('--infer_every', type=int, default=1,
+                        help='run inference on every Nth frame, as in detect.py')
+    parser.add_argument('--motion_threshold', type=float, default=0.0,
+                        help='motion-gated inference threshold, as in detect.py')
+    parser.add_argument('--max_skip', type=int, default=50,
+                        help='forced inference interval with --motion_threshold')
+    parser.add_argument('--track', action='store_true',
+                        help='run the IoU tracker after inference, as in detect.py')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    if args.interpreter == 'cpu':
+        if not args.model:
+            parser.error('--interpreter cpu needs --model')
+        interpreter = CpuInterpreter(args.model)
+    else:
+        interpreter = StubInterpreter(latency=args.stub_latency_ms / 1000)
+
+    results = []
+    for resolution in (parse_resolution(r) for r in args.resolutions.split(',')):
+        frames = load_frames(args.video, resolution, args.clip_frames)
+        for top_k, threshold in itertools.product(
+                [int(k) for k in args.top_k.split(',')],
+                [float(t) for t in args.threshold.split(',')]):
+            result = run_once(frames, interpreter, args, threshold, top_k)
+            result.update(resolution='{}x{}'.format(*resolution),
+                          top_k=top_k, threshold=threshold)
+            results.append(result)
+            stages = ', '.join('{} {:.2f}/{:.2f}'.format(name, s['mean_ms'], s['p95_ms'])
+                               for name, s in sorted(result['stages'].items()))
+            print('{resolution} top_k={top_k} threshold={threshold}: {fps} fps, '
+                  'dropped {dropped}, skipped {skipped}, age {frame_age_ms} ms, rss {peak_rss_mb} MB'.format(**result))
+            print('  stage mean/p95 ms: {}'.format(stages))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
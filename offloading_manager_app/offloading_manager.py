@@ -1,13 +1,19 @@
 import numpy as np
 import pickle
-from collections import defaultdict
-from kubernetes import client, config
+import hashlib
+import os
+import asyncio
+import functools
+import json
+import threading
+from collections import deque, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from kubernetes import client, config, watch
 import requests
-import urllib.parse
 import time
 
 # Prometheus client
-from prometheus_client import Gauge, start_http_server
+from prometheus_client import Counter, Gauge, start_http_server
 
 # Constants
 H = 124500  # Task size in bits
@@ -17,27 +23,84 @@ phi = 6650
 T = 0.5  # Time slice in seconds 
 BETA = 0.9999
 
-# IP Addresses
-IOT_IP = "192.168.0.160"
-EDGE_IP = "192.168.0.147"
+# Q-learning policy
+BUNDLED_MODEL_PATH = 'q_learning_model.pkl'  # Shipped in the image
+MODEL_PATH = os.getenv("MODEL_PATH", BUNDLED_MODEL_PATH)  # Checkpoints go here, keep it in a mounted directory
+MODEL_CHECK_INTERVAL = float(os.getenv("MODEL_CHECK_INTERVAL", "5"))  # Seconds between checks of the model file for changes
+CPU_LEVELS = 10  # Buckets per node CPU utilization, see discretize_state
+NUM_ACTIONS = 2  # 0 = run on IoT, 1 = offload to edge
+
+# Online learning
+ONLINE_LEARNING = os.getenv("ONLINE_LEARNING", "0") == "1"  # Update the Q-table from the observed costs
+LEARNING_RATE = float(os.getenv("LEARNING_RATE", "0.1"))
+DISCOUNT = float(os.getenv("DISCOUNT", "0.9"))
+EPSILON = float(os.getenv("EPSILON", "0.05"))  # Exploration rate while learning online
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "300"))  # Seconds between Q-table checkpoints
+
+# CPU forecast
+FORECAST_METHOD = os.getenv("FORECAST_METHOD", "holt")  # holt, linear or none
+FORECAST_WINDOW = int(os.getenv("FORECAST_WINDOW", "20"))  # Samples per node kept for the linear fit
+FORECAST_LEVEL_SMOOTHING = float(os.getenv("FORECAST_LEVEL_SMOOTHING", "0.5"))  # Holt alpha
+FORECAST_TREND_SMOOTHING = float(os.getenv("FORECAST_TREND_SMOOTHING", "0.3"))  # Holt beta
+
+# Control loop
+TICK_INTERVAL = float(os.getenv("TICK_INTERVAL", "60"))  # Seconds between regular decisions
+FAST_POLL_INTERVAL = float(os.getenv("FAST_POLL_INTERVAL", "5"))  # Seconds between fast-path CPU polls, 0 disables
+FAST_POLL_DELTA = float(os.getenv("FAST_POLL_DELTA", "0.2"))  # Utilization change that triggers an early decision
+ALERT_WEBHOOK_PORT = int(os.getenv("ALERT_WEBHOOK_PORT", "8001"))  # Alertmanager webhook receiver, 0 disables
+
+# Migration guard
+MIN_DWELL = float(os.getenv("MIN_DWELL", "300"))  # Seconds a workload stays put after a migration
+CONFIRM_TICKS = int(os.getenv("CONFIRM_TICKS", "3"))  # Consecutive ticks a new placement must be chosen
+MIGRATION_SECONDS = float(os.getenv("MIGRATION_SECONDS", "30"))  # Outage of a migration until one is measured
+OUTAGE_COST = float(os.getenv("OUTAGE_COST", "1.0"))  # Cost per tick while a workload is being moved
+
+# Kubernetes
+KUBECONFIG_PATH = '/etc/rancher/k3s/k3s.yaml'
+MIGRATION_TIMEOUT = float(os.getenv("MIGRATION_TIMEOUT", "300"))  # Seconds to wait for a rollout
+WATCH_CHUNK = 5  # Seconds per watch request, bounds how long a cancellation can go unnoticed
+
+# Placement
+ROLES = ("iot", "edge")  # Indexed by action: 0 = IoT, 1 = edge
+ROLE_LABEL = "role"  # Node label applied when a node joins the cluster
+HOSTNAME_LABEL = "kubernetes.io/hostname"
+NODE_SELECTOR = f"{ROLE_LABEL} in ({','.join(ROLES)})"
+WORKLOAD_SELECTOR = os.getenv("WORKLOAD_SELECTOR", "offloading=enabled")  # Label of offloadable workloads
+CAPACITY = {"iot": C_iot, "edge": C_edge}
 
 # Prometheus configuration
 PROMETHEUS_URL = "http://localhost:9090/api/v1/query"
-PROMETHEUS_QUERIES = {
-    "iot_device": f'''(1 - sum without (mode) (irate(node_cpu_seconds_total{{job="node-exporter", mode=~"idle|iowait|steal", instance="{IOT_IP}:9100", cluster=""}}[2m]))) / ignoring(cpu) group_left count without (cpu, mode) (node_cpu_seconds_total{{job="node-exporter", mode="idle", instance="{IOT_IP}:9100", cluster=""}})''',
-    "edge_device": f'''(1 - sum without (mode) (irate(node_cpu_seconds_total{{job="node-exporter", mode=~"idle|iowait|steal", instance="{EDGE_IP}:9100", cluster=""}}[2m]))) / ignoring(cpu) group_left count without (cpu, mode) (node_cpu_seconds_total{{job="node-exporter", mode="idle", instance="{EDGE_IP}:9100", cluster=""}})'''
-}
+PROMETHEUS_RANGE_URL = "http://localhost:9090/api/v1/query_range"
+PROMETHEUS_TIMEOUT = (3, 10)  # (connect, read) seconds
+NODE_EXPORTER_PORT = 9100
+# Per-node CPU utilization (0-1), one series per instance matching {instances}
+PROMETHEUS_CPU_QUERY = '''sum by (instance) ((1 - sum without (mode) (irate(node_cpu_seconds_total{{job="node-exporter", mode=~"idle|iowait|steal", instance=~"{instances}", cluster=""}}[2m]))) / ignoring(cpu) group_left count without (cpu, mode) (node_cpu_seconds_total{{job="node-exporter", mode="idle", instance=~"{instances}", cluster=""}}))'''
+
+# Keep-alive connection pool shared by all Prometheus queries
+prometheus_session = requests.Session()
 
 # --- Prometheus Metrics ---
-METRIC_TOTAL_COST = Gauge('myapp_total_cost', 'Combined latency and switching cost')
-METRIC_ACTION = Gauge('myapp_offload_action', '1 if offloaded to edge, 0 if local')
-METRIC_IOT_CPU = Gauge('myapp_iot_cpu_usage_percent', 'IoT device CPU usage in percent')
-METRIC_EDGE_CPU = Gauge('myapp_edge_cpu_usage_percent', 'Edge device CPU usage in percent')
+METRIC_TOTAL_COST = Gauge('myapp_total_cost', 'Combined latency and switching cost of all workloads')
+METRIC_ACTION = Gauge('myapp_offload_action', 'Share of workloads offloaded to edge, 1 or 0 with a single workload')
+METRIC_IOT_CPU = Gauge('myapp_iot_cpu_usage_percent', 'Average IoT node CPU usage in percent')
+METRIC_EDGE_CPU = Gauge('myapp_edge_cpu_usage_percent', 'Average edge node CPU usage in percent')
+METRIC_MIGRATING = Gauge('myapp_migration_in_progress', 'Number of workloads being moved to another node')
+METRIC_NODE_CPU = Gauge('myapp_node_cpu_usage_percent', 'Node CPU usage in percent', ['node', 'role'])
+METRIC_NODE_CPU_FORECAST = Gauge('myapp_node_cpu_forecast_percent',
+                                 'Node CPU usage forecast one migration time ahead in percent', ['node', 'role'])
+METRIC_WORKLOAD_ACTION = Gauge('myapp_workload_offload_action', '1 if the workload is offloaded to edge, 0 if local',
+                               ['namespace', 'workload'])
+METRIC_WORKLOAD_COST = Gauge('myapp_workload_cost', 'Combined latency and switching cost of the workload',
+                             ['namespace', 'workload'])
+METRIC_MIGRATION_SECONDS = Gauge('myapp_migration_seconds', 'Smoothed duration of the workload\'s migrations',
+                                 ['namespace', 'workload'])
+METRIC_Q_UPDATES = Counter('myapp_q_updates_total', 'Online Q-learning updates applied to the Q-table')
+METRIC_MOVES_HELD = Counter('myapp_moves_held_total', 'Placement changes held back by the migration guard',
+                            ['reason'])
 
 def query_prometheus(query):
-    encoded_query = urllib.parse.quote(query, safe="()[],")
-    full_url = f"{PROMETHEUS_URL}?query={encoded_query}"
-    response = requests.get(full_url)
+    response = prometheus_session.get(PROMETHEUS_URL, params={"query": query},
+                                      timeout=PROMETHEUS_TIMEOUT)
     data = response.json()
     if 'data' in data and 'result' in data['data']:
         return data['data']['result']
@@ -45,107 +108,759 @@ def query_prometheus(query):
         return None
 
 
-def get_cpu_usage():
-    iot_cpu_usage = query_prometheus(PROMETHEUS_QUERIES['iot_device'])
-    edge_cpu_usage = query_prometheus(PROMETHEUS_QUERIES['edge_device'])
+def query_prometheus_range(query, start, end, step):
+    response = prometheus_session.get(PROMETHEUS_RANGE_URL, timeout=PROMETHEUS_TIMEOUT,
+                                      params={"query": query, "start": start, "end": end, "step": step})
+    data = response.json()
+    if 'data' in data and 'result' in data['data']:
+        return data['data']['result']
+    else:
+        return None
 
-    iot_total_usage = sum(float(metric['value'][1])
-                          for metric in iot_cpu_usage)
-    edge_total_usage = sum(float(metric['value'][1])
-                           for metric in edge_cpu_usage)
 
-    return iot_total_usage, edge_total_usage
+def cpu_usage_query(node_ips):
+    # Dots are escaped twice: once for the regex and once for the PromQL string.
+    instances = "|".join(f"{ip}:{NODE_EXPORTER_PORT}".replace(".", "\\\\.") for ip in node_ips)
+    return PROMETHEUS_CPU_QUERY.format(instances=instances)
 
 
-def swap_deployment_nodes(decision):
-    config.load_kube_config(config_file='/etc/rancher/k3s/k3s.yaml')
-    api = client.AppsV1Api()
+def get_node_cpu_usage(node_ips):
+    """CPU utilization (0-1) of the node IPs, fetched with a single query.
 
-    deployment_name = "myapp-deployment"
-    namespace = "default"
+    IPs without a series are left out rather than reported idle, so an
+    unmonitored or broken node never looks like the best place to move to.
+    """
+    usage = {}
+    for metric in query_prometheus(cpu_usage_query(node_ips)) or []:
+        ip = metric['metric'].get('instance', '').rsplit(':', 1)[0]
+        usage[ip] = float(metric['value'][1])
+    for ip in node_ips:
+        if ip not in usage:
+            print(f"No CPU usage reported for {ip}, leaving it out of placement decisions.")
+    return usage
 
-    try:
-        deployment = api.read_namespaced_deployment(deployment_name, namespace)
-        current_node = deployment.spec.template.spec.node_selector.get("kubernetes.io/hostname")
-        new_node = "iot" if decision == 0 else "nuc2"
 
-        if current_node == new_node:
-            print(f"No change needed. Current node is already '{current_node}'.\n")
-            return
+_kube_apis = {}
+
+
+def get_kube_api(api_class):
+    # Load the kubeconfig once and reuse the clients for every call
+    if not _kube_apis:
+        config.load_kube_config(config_file=KUBECONFIG_PATH)
+    if api_class not in _kube_apis:
+        _kube_apis[api_class] = api_class()
+    return _kube_apis[api_class]
+
+
+def get_apps_api():
+    return get_kube_api(client.AppsV1Api)
+
+
+def get_core_api():
+    return get_kube_api(client.CoreV1Api)
+
+
+Node = namedtuple('Node', ['name', 'hostname', 'role', 'ip'])
+
+
+class Workload(namedtuple('Workload', ['kind', 'namespace', 'name', 'replicas', 'node_selector'])):
+    """A Deployment or StatefulSet whose pods the manager may move."""
+
+    @property
+    def key(self):
+        return f"{self.namespace}/{self.kind}/{self.name}"
+
+
+def discover_nodes():
+    """Ready, schedulable nodes labelled role=iot or role=edge."""
+    nodes = []
+    for node in get_core_api().list_node(label_selector=NODE_SELECTOR).items:
+        labels = node.metadata.labels or {}
+        ip = next((a.address for a in node.status.addresses or [] if a.type == "InternalIP"), None)
+        ready = any(c.type == "Ready" and c.status == "True" for c in node.status.conditions or [])
+        if ip and ready and not node.spec.unschedulable:
+            nodes.append(Node(node.metadata.name, labels.get(HOSTNAME_LABEL, node.metadata.name),
+                              labels[ROLE_LABEL], ip))
+    return nodes
+
 
-        deployment.spec.template.spec.node_selector = {"kubernetes.io/hostname": new_node}
-        api.patch_namespaced_deployment(deployment_name, namespace, deployment)
-        print(f"Deployment '{deployment_name}' is being swapped to run on '{new_node}'.")
-        wait_for_deployment_to_run(api, deployment_name, namespace)
+def discover_workloads(label_selector=WORKLOAD_SELECTOR):
+    """Deployments and StatefulSets in any namespace matching `label_selector`."""
+    api = get_apps_api()
+    workloads = []
+    for kind, list_all in (("Deployment", api.list_deployment_for_all_namespaces),
+                           ("StatefulSet", api.list_stateful_set_for_all_namespaces)):
+        for obj in list_all(label_selector=label_selector).items:
+            replicas = obj.spec.replicas if obj.spec.replicas is not None else 1
+            workloads.append(Workload(kind, obj.metadata.namespace, obj.metadata.name, replicas,
+                                      obj.spec.template.spec.node_selector or {}))
+    return workloads
+
+
+def move_workload(workload, node_selector, cancel_event=None, timeout=MIGRATION_TIMEOUT):
+    """Points the workload's pods at `node_selector` and waits for the rollout."""
+    try:
+        api = get_apps_api()
+        # Strategic merge patch: a None value removes the key, so a hostname pin
+        # left over from an earlier placement doesn't conflict with the new role.
+        patch = {"spec": {"template": {"spec": {"nodeSelector": {
+            ROLE_LABEL: node_selector.get(ROLE_LABEL), HOSTNAME_LABEL: node_selector.get(HOSTNAME_LABEL)}}}}}
+        if workload.kind == "StatefulSet":
+            api.patch_namespaced_stateful_set(workload.name, workload.namespace, patch)
+        else:
+            api.patch_namespaced_deployment(workload.name, workload.namespace, patch)
+        target = node_selector.get(HOSTNAME_LABEL) or f"{ROLE_LABEL}={node_selector[ROLE_LABEL]}"
+        print(f"{workload.kind} '{workload.key}' is being moved to run on '{target}'.")
+        return wait_for_rollout(api, workload, timeout, cancel_event)
 
     except Exception as e:
         print(f"An error occurred: {e}")
+        return False
+
+
+def rollout_complete(obj):
+    # Same conditions as `kubectl rollout status`: the new spec is observed and
+    # every replica is updated and available.
+    replicas = obj.spec.replicas if obj.spec.replicas is not None else 1
+    status = obj.status
+    return ((status.observed_generation or 0) >= (obj.metadata.generation or 0)
+            and (status.updated_replicas or 0) >= replicas
+            and (status.available_replicas or 0) >= replicas)
 
 
-def wait_for_deployment_to_run(api, deployment_name, namespace):
+def wait_for_rollout(api, workload, timeout=MIGRATION_TIMEOUT, cancel_event=None):
+    # Watch the workload instead of polling; the first event is its current state.
+    list_fn = (api.list_namespaced_stateful_set if workload.kind == "StatefulSet"
+               else api.list_namespaced_deployment)
+    deadline = time.monotonic() + timeout
+    w = watch.Watch()
     while True:
-        status = api.read_namespaced_deployment_status(deployment_name, namespace)
-        if status.status.available_replicas and status.status.available_replicas > 0:
-            print(f"Deployment '{deployment_name}' is now running with {status.status.available_replicas} replica(s).\n")
-            break
-        else:
-            print(f"Waiting for deployment '{deployment_name}' to be in Running state...\n")
-            time.sleep(10)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"Timed out after {timeout:.0f}s waiting for '{workload.key}' to roll out.\n")
+            return False
+        for event in w.stream(list_fn, workload.namespace,
+                              field_selector=f"metadata.name={workload.name}",
+                              timeout_seconds=max(1, int(min(remaining, WATCH_CHUNK)))):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            obj = event['object']
+            if event['type'] != 'DELETED' and rollout_complete(obj):
+                w.stop()
+                print(f"'{workload.key}' is now running with {obj.status.available_replicas} replica(s).\n")
+                return True
+        if cancel_event is not None and cancel_event.is_set():
+            w.stop()
+            print(f"Stopped waiting for '{workload.key}', migration was superseded.\n")
+            return False
 
 
 def discretize_state(iot_cpu, edge_cpu, prev_action):
-    iot_cpu_level = min(int(iot_cpu * 10), 9)
-    edge_cpu_level = min(int(edge_cpu * 10), 9)
+    # Also takes NumPy arrays, so the trainer can discretize a whole batch of states
+    iot_cpu_level = np.minimum(np.int_(np.multiply(iot_cpu, CPU_LEVELS)), CPU_LEVELS - 1)
+    edge_cpu_level = np.minimum(np.int_(np.multiply(edge_cpu, CPU_LEVELS)), CPU_LEVELS - 1)
     return (iot_cpu_level, edge_cpu_level, prev_action)
 
 
-def make_offloading_decision(iot_usage, edge_usage, prev_action, model_path='q_learning_model.pkl'):
-    with open(model_path, 'rb') as f:
-        q_table = defaultdict(lambda: np.zeros(2), pickle.load(f))
+class QTablePolicy:
+    """Q-table held as a dense (iot_level, edge_level, prev_action, action) array.
+
+    The pickled dict is read once; afterwards the file is stat'ed at most
+    every MODEL_CHECK_INTERVAL seconds and reloaded only when its mtime/size
+    changed and its content hash differs, so a new model can be dropped in
+    without restarting the pod. States missing from the dict stay at zero,
+    as with the defaultdict used before.
+
+    In online-learning mode `update` applies Q-learning steps to the table
+    and `save` checkpoints it in the same format; a model dropped in later
+    still replaces the learned table.
+    """
+
+    def __init__(self, model_path, check_interval=MODEL_CHECK_INTERVAL):
+        self.model_path = model_path
+        self.check_interval = check_interval
+        self.q_values = np.zeros((CPU_LEVELS, CPU_LEVELS, NUM_ACTIONS, NUM_ACTIONS))
+        self.known = np.zeros(self.q_values.shape[:-1], dtype=bool)  # States present in the model
+        self._stat = None
+        self._digest = None
+        self._next_check = 0.0
+        self.reload_if_changed(force=True)
+
+    def reload_if_changed(self, force=False):
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        stat = os.stat(self.model_path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._stat:
+            return False
+        with open(self.model_path, 'rb') as f:
+            raw = f.read()
+        self._stat = stat_key
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest == self._digest:
+            return False
+        q_values = np.zeros_like(self.q_values)
+        known = np.zeros_like(self.known)
+        for state, values in pickle.loads(raw).items():
+            q_values[state] = values
+            known[state] = True
+        self.q_values, self.known = q_values, known
+        self._digest = digest
+        print(f"Loaded Q-table from '{self.model_path}' (sha256 {digest[:12]}).")
+        return True
+
+    def decide(self, state):
+        try:
+            self.reload_if_changed()
+        except Exception as e:
+            # Keep deciding with the table we have, e.g. while a new file is half-written.
+            print(f"Failed to reload Q-table, keeping the current one: {e}")
+        return int(np.argmax(self.q_values[state]))
+
+    def update(self, state, action, cost, next_state, alpha=LEARNING_RATE, gamma=DISCOUNT):
+        # Rewards are negative costs, as in train_q_table.py
+        index = state + (action,)
+        target = -cost + gamma * self.q_values[next_state].max()
+        self.q_values[index] += alpha * (target - self.q_values[index])
+        self.known[state] = True
+
+    def save(self):
+        model = {tuple(int(level) for level in state): self.q_values[state].copy()
+                 for state in zip(*np.nonzero(self.known))}
+        raw = pickle.dumps(model)
+        write_model(raw, self.model_path)
+        # Our own checkpoint is not a new model to reload
+        stat = os.stat(self.model_path)
+        self._stat = (stat.st_mtime_ns, stat.st_size)
+        self._digest = hashlib.sha256(raw).hexdigest()
+        return len(model)
+
+
+def write_model(raw, model_path):
+    # Written next to the model and renamed over it, so a reader never sees half a file.
+    # The rename fails on a file bind-mounted over model_path, hence the directory mount.
+    tmp_path = f"{model_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(raw)
+    os.replace(tmp_path, model_path)
+
+
+def seed_model(model_path=MODEL_PATH, bundled_path=BUNDLED_MODEL_PATH):
+    # An empty model volume starts from the model shipped in the image
+    if not os.path.exists(model_path) and os.path.abspath(model_path) != os.path.abspath(bundled_path):
+        with open(bundled_path, 'rb') as f:
+            write_model(f.read(), model_path)
+        print(f"Copied '{bundled_path}' to '{model_path}'.")
+
+
+_policies = {}
+
+
+def load_policy(model_path=MODEL_PATH):
+    if model_path not in _policies:
+        _policies[model_path] = QTablePolicy(model_path)
+    return _policies[model_path]
+
+
+def make_offloading_decision(iot_usage, edge_usage, prev_action, model_path=MODEL_PATH):
     state = discretize_state(iot_usage, edge_usage, prev_action)
-    return np.argmax(q_table[state])
-
-
-def main():
-    # Start Prometheus metrics HTTP server on port 8000
-    start_http_server(8000, addr='0.0.0.0')
-    prev_action = 0
+    return load_policy(model_path).decide(state)
+
+
+def compute_cost(iot_usage, edge_usage, decision, prev_action):
+    # Element-wise on NumPy arrays as well as on scalars
+    # Raw latency calculations based on decision
+    latency_edge_raw = (2 * decision - 1) * (phi * H) / (C_edge * T) + edge_usage
+    latency_iot_raw = (2 * (1 - decision) - 1) * (phi * H) / (C_iot * T) + iot_usage
+
+    # Clip the latencies to [0, 1] to bound them
+    latency_edge = np.clip(latency_edge_raw, 0, 1)
+    latency_iot = np.clip(latency_iot_raw, 0, 1)
+
+    # Cost components
+    C1t = np.minimum(np.abs(latency_iot - latency_edge), 1e6)  # bounded cost difference
+    C2t = np.not_equal(decision, prev_action) * 1  # switching cost
+
+    return BETA * C1t + (1 - BETA) * C2t
+
+
+class Placement(namedtuple('Placement', ['workload', 'action', 'node_selector', 'iot_usage', 'edge_usage',
+                                          'measured_usage', 'prev_action', 'cost', 'held'])):
+    """Where plan_placements wants a workload, and the state it decided on.
+
+    `iot_usage`/`edge_usage` are what it decided on, the forecast when there
+    is one; `measured_usage` is the measured (iot, edge) utilization of the
+    same candidates, which `cost` is computed from. `held` is the
+    MigrationGuard's reason for keeping the current placement instead, or
+    None when the change may go ahead.
+    """
+
+    @property
+    def moves(self):
+        return any(self.workload.node_selector.get(label) != self.node_selector.get(label)
+                   for label in (ROLE_LABEL, HOSTNAME_LABEL))
+
+
+def task_load(role):
+    # CPU utilization one replica adds to a node of `role`, the same term compute_cost uses
+    return (phi * H) / (CAPACITY[role] * T)
+
+
+def current_placement(workload, nodes_by_hostname):
+    """(role, node) the workload is pinned to; node is None when only the role is set."""
+    node = nodes_by_hostname.get(workload.node_selector.get(HOSTNAME_LABEL))
+    if node is not None:
+        return node.role, node
+    return workload.node_selector.get(ROLE_LABEL), None
+
+
+def plan_placements(workloads, nodes, usage, model_path=MODEL_PATH, epsilon=0.0, guard=None, now=None,
+                    measured=None):
+    """Decides where every workload should run.
+
+    The Q-table still compares one IoT node with one edge node, so each
+    workload is offered one candidate per role: the least loaded node of
+    that role, or the node it already runs on unless moving would free more
+    than the workload's own task load. A workload with several replicas is
+    placed on a role instead and left to the scheduler to spread, with the
+    role's average utilization as its state. Workloads are planned one after
+    the other and every move shifts its task load between the projected
+    utilization of the nodes involved, so later workloads see it. With a
+    `guard`, each change is checked as it is planned and only the moves it
+    lets through shift the projection; held ones leave the load where it is.
+    `usage` maps node IPs to CPU utilization (0-1) to decide on; costs are
+    computed from `measured`, which defaults to `usage`. Nodes missing from
+    `measured` are never candidates, and workloads pinned to one of them are
+    left where they are. With `epsilon`, that share of decisions is random,
+    for exploration while learning online.
+    """
+    measured = usage if measured is None else measured
+    nodes_by_hostname = {node.hostname: node for node in nodes}
+    nodes = [node for node in nodes if node.ip in measured]
+    projected = {node.name: usage.get(node.ip, measured[node.ip]) for node in nodes}
+    projected_measured = {node.name: measured[node.ip] for node in nodes}
+    by_role = {role: [node for node in nodes if node.role == role] for role in ROLES}
+    plans = []
+    for workload in workloads:
+        if not all(by_role.values()):
+            break
+        current_role, current_node = current_placement(workload, nodes_by_hostname)
+        if current_node is not None and current_node.name not in projected:
+            continue
+        prev_action = ROLES.index(current_role) if current_role in ROLES else 0
+
+        candidates, load, measured_load = [], [], []
+        for role in ROLES:
+            if workload.replicas > 1:
+                candidates.append(None)
+                load.append(sum(projected[n.name] for n in by_role[role]) / len(by_role[role]))
+                measured_load.append(sum(projected_measured[n.name] for n in by_role[role]) / len(by_role[role]))
+            else:
+                node = min(by_role[role], key=lambda n: projected[n.name])
+                if (current_node is not None and current_node.role == role
+                        and projected[current_node.name] - projected[node.name] <= task_load(role)):
+                    node = current_node
+                candidates.append(node)
+                load.append(projected[node.name])
+                measured_load.append(projected_measured[node.name])
+
+        action = make_offloading_decision(load[0], load[1], prev_action, model_path)
+        if epsilon and np.random.random() < epsilon:
+            action = np.random.randint(NUM_ACTIONS)
+        role, node = ROLES[action], candidates[action]
+        node_selector = {ROLE_LABEL: role}
+        if node is not None:
+            node_selector[HOSTNAME_LABEL] = node.hostname
+        cost = compute_cost(measured_load[0], measured_load[1], action, prev_action)
+        plan = Placement(workload, action, node_selector, load[0], load[1], tuple(measured_load),
+                         prev_action, cost, None)
+        if guard is not None:
+            allowed, reason = guard.allow(plan, now)
+            plan = plan._replace(held=None if allowed else reason)
+        if plan.held is None and (role, node) != (current_role, current_node):
+            shifts = [([node] if node is not None else by_role[role], task_load(role))]
+            if current_role in ROLES:
+                sources = [current_node] if current_node is not None else by_role[current_role]
+                shifts.append((sources, -task_load(current_role)))
+            for targets, delta in shifts:
+                for target in targets:
+                    projected[target.name] += delta * workload.replicas / len(targets)
+                    projected_measured[target.name] += delta * workload.replicas / len(targets)
+        plans.append(plan)
+    return plans
+
+
+class CpuForecaster:
+    """Short-horizon CPU utilization forecast per node.
+
+    Every observed sample goes into a ring buffer of the node's last
+    `window` samples and updates a Holt (double exponential smoothing)
+    level and trend, both over real timestamps since ticks and fast-path
+    polls arrive at irregular intervals. A sample less than `min_interval`
+    seconds after the last Holt update is only buffered; over such short
+    gaps the trend would mostly be noise. `forecast` extrapolates `horizon`
+    seconds past the latest sample with the Holt trend, with a least-squares
+    line through the ring buffer ("linear"), or returns the latest sample
+    ("none"). Forecasts are clipped to [0, 1].
+    """
+
+    def __init__(self, method=FORECAST_METHOD, window=FORECAST_WINDOW,
+                 level_smoothing=FORECAST_LEVEL_SMOOTHING, trend_smoothing=FORECAST_TREND_SMOOTHING,
+                 min_interval=1.0):
+        if method not in ("holt", "linear", "none"):
+            raise ValueError(f"Unknown forecast method '{method}'")
+        self.method = method
+        self.window = window
+        self.level_smoothing = level_smoothing
+        self.trend_smoothing = trend_smoothing
+        self.min_interval = min_interval
+        self.history = {}  # Node IP -> deque of (time, usage)
+        self.holt = {}  # Node IP -> (time, level, trend per second)
+
+    def observe(self, usage, now=None):
+        now = time.monotonic() if now is None else now
+        for ip, value in usage.items():
+            self.history.setdefault(ip, deque(maxlen=self.window)).append((now, value))
+            if ip not in self.holt:
+                self.holt[ip] = (now, value, 0.0)
+                continue
+            then, level, trend = self.holt[ip]
+            dt = now - then
+            if dt < self.min_interval:
+                continue
+            new_level = self.level_smoothing * value + (1 - self.level_smoothing) * (level + trend * dt)
+            trend = self.trend_smoothing * (new_level - level) / dt + (1 - self.trend_smoothing) * trend
+            self.holt[ip] = (now, new_level, trend)
+
+    def forecast(self, horizon):
+        """Node IP -> utilization expected `horizon` seconds after the latest sample."""
+        predicted = {}
+        for ip, samples in self.history.items():
+            if self.method == "holt":
+                _, level, trend = self.holt[ip]
+                value = level + trend * horizon
+            elif self.method == "linear" and samples[-1][0] - samples[0][0] >= self.min_interval:
+                times, values = np.array(samples).T
+                times -= times[-1]
+                centered = times - times.mean()
+                slope = np.dot(centered, values) / np.dot(centered, centered)
+                value = values.mean() + slope * (horizon - times.mean())
+            else:
+                value = samples[-1][1]
+            predicted[ip] = min(max(float(value), 0.0), 1.0)
+        return predicted
+
+
+class MigrationGuard:
+    """Decides whether a planned placement change is worth a migration.
+
+    The switching term of compute_cost is weighted by only 1 - BETA, while a
+    real migration takes the workload down until its rollout completes. A
+    change is let through once the same target was planned on
+    `confirm_ticks` consecutive ticks spanning as long as that many regular
+    ticks (fast-path and webhook ticks alone can't confirm a move within
+    seconds of a spike), at least `min_dwell` seconds after
+    the workload's last migration started, and, for a move between IoT and
+    edge, when the latency cost it saves over `min_dwell` exceeds the
+    outage: the measured migration time in ticks times `outage_cost`.
+    Migration times are smoothed per workload and start at
+    `migration_seconds`. Moves between nodes of the same role only need to
+    be confirmed and respect the dwell time.
+    """
+
+    def __init__(self, min_dwell=MIN_DWELL, confirm_ticks=CONFIRM_TICKS, migration_seconds=MIGRATION_SECONDS,
+                 outage_cost=OUTAGE_COST, tick_interval=TICK_INTERVAL, smoothing=0.3):
+        self.min_dwell = min_dwell
+        self.confirm_ticks = confirm_ticks
+        self.migration_seconds = migration_seconds
+        self.outage_cost = outage_cost
+        self.tick_interval = tick_interval
+        self.smoothing = smoothing
+        self.pending = {}  # Workload key -> (node_selector, consecutive ticks planned, time first planned)
+        self.last_move = {}  # Workload key -> monotonic time the last migration started
+        self.durations = {}  # Workload key -> smoothed migration seconds
+
+    def migration_cost(self, key):
+        return self.durations.get(key, self.migration_seconds) / self.tick_interval * self.outage_cost
+
+    def allow(self, plan, now=None):
+        """(True, None) to migrate now, otherwise (False, reason)."""
+        key = plan.workload.key
+        if not plan.moves:
+            self.pending.pop(key, None)
+            return True, None
+        now = time.monotonic() if now is None else now
+
+        target, ticks, since = self.pending.get(key, (None, 0, now))
+        if target != plan.node_selector:
+            ticks, since = 0, now
+        ticks += 1
+        self.pending[key] = (plan.node_selector, ticks, since)
+        # Half a tick of slack, so scheduling jitter doesn't cost a whole extra regular tick
+        confirm_seconds = max(self.confirm_ticks - 1.5, 0) * self.tick_interval
+        if ticks < self.confirm_ticks or now - since < confirm_seconds:
+            return False, "unconfirmed"
+        if now - self.last_move.get(key, -np.inf) < self.min_dwell:
+            return False, "dwell"
+        if plan.action != plan.prev_action:
+            # Latency cost only: deciding for the current action drops the switching term
+            saved = (compute_cost(plan.iot_usage, plan.edge_usage, plan.prev_action, plan.prev_action)
+                     - compute_cost(plan.iot_usage, plan.edge_usage, plan.action, plan.action))
+            if saved * max(self.min_dwell / self.tick_interval, 1) <= self.migration_cost(key):
+                return False, "cost"
+        del self.pending[key]
+        return True, None
+
+    def expected_seconds(self):
+        # Average measured migration time, the horizon the CPU forecast looks ahead
+        if not self.durations:
+            return self.migration_seconds
+        return float(np.mean(list(self.durations.values())))
+
+    def started(self, key, now=None):
+        self.last_move[key] = time.monotonic() if now is None else now
+
+    def finished(self, key, seconds):
+        previous = self.durations.get(key)
+        self.durations[key] = seconds if previous is None else \
+            (1 - self.smoothing) * previous + self.smoothing * seconds
+        return self.durations[key]
+
+
+class AlertWebhookHandler(BaseHTTPRequestHandler):
+    """Receives Alertmanager webhook POSTs and triggers an early decision."""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            payload = {}
+        firing = [alert.get("labels", {}).get("alertname", "?")
+                  for alert in payload.get("alerts", []) if alert.get("status") == "firing"]
+        if firing:
+            print(f"Alert webhook: {', '.join(firing)} firing, deciding now.")
+            self.server.on_alert()
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OffloadingController:
+    """Asyncio control loop that decides every TICK_INTERVAL or on demand.
+
+    Every tick rediscovers the offloadable workloads and the iot/edge
+    nodes, so pipelines and nodes can be added without a restart. Besides
+    the regular fixed-rate tick, a decision runs as soon as an Alertmanager
+    webhook reports a firing alert or the fast-path poll sees any node's
+    utilization move by FAST_POLL_DELTA since the last decision. Blocking
+    Prometheus and Kubernetes calls run in the default executor so the
+    triggers stay responsive. Placement changes only go ahead once the
+    MigrationGuard lets them through. Migrations run in the background, one
+    per workload: ticks keep sampling and exporting metrics during a
+    rollout, and a new placement for the same workload supersedes the one
+    in flight.
+
+    With `online` set, each tick also applies a Q-learning update for every
+    workload's previous decision: the action actually taken (the planned one
+    or, when the guard held it, the current placement), its cost, and the
+    state seen now. Decisions explore with probability `epsilon` and the
+    table is checkpointed every `checkpoint_interval` seconds.
+
+    Decisions are made on the CpuForecaster's utilization one expected
+    migration time ahead, so a workload starts moving before its node
+    saturates. Fast-path polls feed the forecaster too. Exported costs and
+    the online updates use the measured utilization, the cost actually paid.
+    """
+
+    def __init__(self, tick_interval=TICK_INTERVAL, fast_poll_interval=FAST_POLL_INTERVAL,
+                 fast_poll_delta=FAST_POLL_DELTA, webhook_port=ALERT_WEBHOOK_PORT, guard=None,
+                 online=ONLINE_LEARNING, epsilon=EPSILON, checkpoint_interval=CHECKPOINT_INTERVAL,
+                 forecaster=None):
+        self.tick_interval = tick_interval
+        self.fast_poll_interval = fast_poll_interval
+        self.fast_poll_delta = fast_poll_delta
+        self.webhook_port = webhook_port
+        self.guard = guard or MigrationGuard(tick_interval=tick_interval)
+        self.nodes = []
+        self.last_usage = None
+        self.trigger = None
+        self.migrations = {}  # Workload key -> (future, node_selector, cancel_event)
+        self.forecaster = forecaster or CpuForecaster()
+        self.reported = {METRIC_NODE_CPU: set(), METRIC_NODE_CPU_FORECAST: set(),
+                         METRIC_WORKLOAD_ACTION: set(), METRIC_WORKLOAD_COST: set()}
+        self.online = online
+        self.epsilon = epsilon if online else 0.0
+        self.checkpoint_interval = checkpoint_interval
+        self.next_checkpoint = time.monotonic() + checkpoint_interval
+        self.transitions = {}  # Workload key -> (state, action, cost) awaiting its next state
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.trigger = asyncio.Event()
+        if self.webhook_port:
+            self._start_webhook(loop)
+        if self.fast_poll_interval:
+            loop.create_task(self._fast_poll())
+
+        while True:
+            # Measured from the start of the tick, so slow ticks don't stretch the period.
+            next_tick = loop.time() + self.tick_interval
+            try:
+                await self.tick()
+            except Exception as e:
+                # A Prometheus or API server hiccup skips this decision, not the manager's state
+                print(f"Tick failed: {e}")
+            try:
+                await asyncio.wait_for(self.trigger.wait(), max(next_tick - loop.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+            self.trigger.clear()
+
+    async def tick(self):
+        loop = asyncio.get_running_loop()
+        nodes = await loop.run_in_executor(None, discover_nodes)
+        workloads = await loop.run_in_executor(None, discover_workloads)
+        usage = await loop.run_in_executor(None, get_node_cpu_usage, [node.ip for node in nodes])
+        self.nodes, self.last_usage = nodes, usage
+        self.forecaster.observe(usage)
+
+        roles = {node.role for node in nodes if node.ip in usage}
+        if len(roles) < len(ROLES):
+            print(f"Need at least one ready, monitored node per role {ROLES}, found {sorted(roles)}; "
+                  f"skipping decision.")
+            return
+        if not workloads:
+            print(f"No workloads match '{WORKLOAD_SELECTOR}'; nothing to place.")
+            return
 
-    while True:
-        iot_usage, edge_usage = get_cpu_usage()
-        
-        iot_percent = iot_usage * 100
-        edge_percent = edge_usage * 100
-        
-        decision = make_offloading_decision(iot_usage, edge_usage, prev_action)
-       
-        # Raw latency calculations based on decision
-        latency_edge_raw = (2 * decision - 1) * (phi * H) / (C_edge * T) + edge_usage
-        latency_iot_raw = (2 * (1 - decision) - 1) * (phi * H) / (C_iot * T) + iot_usage
-
-        # Clip the latencies to [0, 1] to bound them
-        latency_edge = np.clip(latency_edge_raw, 0, 1)
-        latency_iot = np.clip(latency_iot_raw, 0, 1)
-
-        # Cost components
-        C1t = min(np.abs(latency_iot - latency_edge), 1e6)  # bounded cost difference
-        C2t = int(decision != prev_action)  # switching cost
-
-        C_total = BETA * C1t + (1 - BETA) * C2t
+        predicted = self.forecaster.forecast(self.guard.expected_seconds())
+        plans = plan_placements(workloads, nodes, predicted, epsilon=self.epsilon, guard=self.guard, measured=usage)
 
         # Update Prometheus metrics
-        METRIC_TOTAL_COST.set(C_total)
-        METRIC_ACTION.set(decision)
-        METRIC_IOT_CPU.set(iot_percent)
-        METRIC_EDGE_CPU.set(edge_percent)
-
-        print(f"Current state: IoT {iot_usage:.2f}, Edge {edge_usage:.2f}")
-        print(f"Decision: {'Edge' if decision == 1 else 'IoT'}")
+        nodes = [node for node in nodes if node.ip in usage]
+        self._report(METRIC_NODE_CPU, {(node.name, node.role): usage[node.ip] * 100 for node in nodes})
+        self._report(METRIC_NODE_CPU_FORECAST, {(node.name, node.role): predicted[node.ip] * 100 for node in nodes})
+        self._report(METRIC_WORKLOAD_ACTION, {(p.workload.namespace, p.workload.name): p.action for p in plans})
+        self._report(METRIC_WORKLOAD_COST, {(p.workload.namespace, p.workload.name): p.cost for p in plans})
+        METRIC_TOTAL_COST.set(sum(p.cost for p in plans))
+        if plans:
+            METRIC_ACTION.set(sum(p.action for p in plans) / len(plans))
+        METRIC_IOT_CPU.set(100 * np.mean([usage[n.ip] for n in nodes if n.role == "iot"]))
+        METRIC_EDGE_CPU.set(100 * np.mean([usage[n.ip] for n in nodes if n.role == "edge"]))
+
+        for plan in plans:
+            target = plan.node_selector.get(HOSTNAME_LABEL, f"any {ROLES[plan.action]} node")
+            print(f"{plan.workload.key}: forecast IoT {plan.iot_usage:.2f}, Edge {plan.edge_usage:.2f}, "
+                  f"decision {'Edge' if plan.action == 1 else 'IoT'} ({target})")
+            if plan.held is None:
+                self._start_migration(loop, plan)
+            else:
+                METRIC_MOVES_HELD.labels(plan.held).inc()
+                print(f"{plan.workload.key}: holding the current placement ({plan.held}).")
+            if self.online:
+                self._learn(plan, plan.action if plan.held is None else plan.prev_action)
+
+        if self.online:
+            current = {plan.workload.key for plan in plans}
+            self.transitions = {key: t for key, t in self.transitions.items() if key in current}
+            if time.monotonic() >= self.next_checkpoint:
+                self._checkpoint()
+
+    def _learn(self, plan, action):
+        # Q-update for the workload's previous decision, now that its next state is known
+        policy = load_policy()
+        key = plan.workload.key
+        state = discretize_state(plan.iot_usage, plan.edge_usage, plan.prev_action)
+        if key in self.transitions:
+            policy.update(*self.transitions[key], state)
+            METRIC_Q_UPDATES.inc()
+        # The state is what was decided on, the cost what the measured utilization incurs
+        cost = compute_cost(*plan.measured_usage, action, plan.prev_action)
+        self.transitions[key] = (state, action, cost)
+
+    def _checkpoint(self):
+        policy = load_policy()
+        try:
+            states = policy.save()
+            print(f"Checkpointed {states} Q-table states to '{policy.model_path}'.")
+        except OSError as e:
+            print(f"Failed to checkpoint the Q-table to '{policy.model_path}': {e}. "
+                  f"MODEL_PATH must be in a writable, mounted directory, not a mounted file.")
+        self.next_checkpoint = time.monotonic() + self.checkpoint_interval
+
+    def _report(self, gauge, values):
+        # Set a labelled gauge and drop the series of nodes/workloads that disappeared
+        for labels, value in values.items():
+            gauge.labels(*labels).set(value)
+        for labels in self.reported[gauge] - values.keys():
+            gauge.remove(*labels)
+        self.reported[gauge] = set(values)
+
+    def _start_migration(self, loop, plan):
+        key = plan.workload.key
+        if key in self.migrations:
+            future, node_selector, cancel_event = self.migrations[key]
+            if not future.done():
+                if node_selector == plan.node_selector:
+                    return
+                cancel_event.set()
+            del self.migrations[key]
+        if not plan.moves:
+            return
+        cancel_event = threading.Event()
+        future = loop.run_in_executor(None, move_workload, plan.workload, plan.node_selector, cancel_event)
+        self.migrations[key] = (future, plan.node_selector, cancel_event)
+        self.guard.started(key)
+        future.add_done_callback(functools.partial(self._migration_done, plan.workload, time.monotonic()))
+        self._count_migrations()
+
+    def _migration_done(self, workload, start, future):
+        # Only completed rollouts measure the outage; failed or superseded ones say little about it
+        if not future.cancelled() and future.exception() is None and future.result():
+            seconds = self.guard.finished(workload.key, time.monotonic() - start)
+            METRIC_MIGRATION_SECONDS.labels(workload.namespace, workload.name).set(seconds)
+        self._count_migrations()
+
+    def _count_migrations(self):
+        METRIC_MIGRATING.set(sum(not future.done() for future, _, _ in self.migrations.values()))
+
+    async def _fast_poll(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.fast_poll_interval)
+            if not self.nodes or not self.last_usage:
+                continue
+            try:
+                usage = await loop.run_in_executor(None, get_node_cpu_usage,
+                                                   [node.ip for node in self.nodes])
+            except Exception as e:
+                print(f"Fast-path poll failed: {e}")
+                continue
+            self.forecaster.observe(usage)
+            moved = [node for node in self.nodes if node.ip in usage and node.ip in self.last_usage and
+                     abs(usage[node.ip] - self.last_usage[node.ip]) >= self.fast_poll_delta]
+            if moved:
+                print("CPU moved on " + ", ".join(
+                    f"{node.name} ({self.last_usage[node.ip]:.2f} -> {usage[node.ip]:.2f})" for node in moved)
+                      + ", deciding now.")
+                self.trigger.set()
+
+    def _start_webhook(self, loop):
+        server = ThreadingHTTPServer(('0.0.0.0', self.webhook_port), AlertWebhookHandler)
+        server.on_alert = lambda: loop.call_soon_threadsafe(self.trigger.set)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
 
-        swap_deployment_nodes(decision)
-        prev_action = decision
 
-        time.sleep(60)
+def main():
+    # Start Prometheus metrics HTTP server on port 8000
+    start_http_server(8000, addr='0.0.0.0')
+    seed_model()
+    asyncio.run(OffloadingController().run())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,208 @@
+"""Replays recorded CPU utilization through the offloading decision path.
+
+Feeds IoT/edge utilization time series, fetched from Prometheus with
+query_range or read from a CSV, through discretize_state,
+make_offloading_decision, the MigrationGuard and compute_cost exactly as
+the manager's control loop does, and reports the total cost, the number of
+switches and held moves and the decision latency of every model and BETA
+value. Decisions can be made on the manager's CPU forecast, and a placement
+only takes effect one migration time after it was decided, as on the
+cluster.
+
+Fetch a week of history at the manager's decision interval and keep a copy:
+python3 replay_simulator.py --iot_ip 192.168.0.160 --edge_ip 192.168.0.147 \
+  --days 7 --save_csv week.csv --models q_learning_model.pkl
+
+Sweep models and BETA values over the saved history:
+python3 replay_simulator.py --csv week.csv --models q_learning_model.pkl new.pkl \
+  --beta 0.9999 0.99 0.9 --json results.json
+
+The CSV has a header and one row per decision: timestamp,iot_cpu,edge_cpu
+with utilizations in [0, 1].
+"""
+import argparse
+import csv
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+import offloading_manager as om
+
+MAX_POINTS = 10000  # Prometheus rejects range queries above 11000 points per series
+
+
+def load_csv(path):
+    with open(path, newline='') as f:
+        rows = [(float(row['timestamp']), float(row['iot_cpu']), float(row['edge_cpu']))
+                for row in csv.DictReader(f)]
+    timestamps, iot, edge = (np.array(column) for column in zip(*rows))
+    return timestamps, iot, edge
+
+
+def save_csv(path, timestamps, iot, edge):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['timestamp', 'iot_cpu', 'edge_cpu'])
+        writer.writerows(zip(timestamps, iot, edge))
+
+
+def fetch_prometheus(iot_ip, edge_ip, start, end, step):
+    """Utilization of both nodes from `start` to `end` (unix seconds) every `step`.
+
+    The range is split into queries of at most MAX_POINTS samples; only
+    timestamps where both nodes have a sample are kept.
+    """
+    query = om.cpu_usage_query([iot_ip, edge_ip])
+    series = {iot_ip: {}, edge_ip: {}}
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + step * (MAX_POINTS - 1), end)
+        for metric in om.query_prometheus_range(query, chunk_start, chunk_end, step) or []:
+            ip = metric['metric'].get('instance', '').rsplit(':', 1)[0]
+            if ip in series:
+                series[ip].update((float(ts), float(value)) for ts, value in metric['values'])
+        chunk_start = chunk_end + step
+    timestamps = np.array(sorted(series[iot_ip].keys() & series[edge_ip].keys()))
+    iot = np.array([series[iot_ip][ts] for ts in timestamps])
+    edge = np.array([series[edge_ip][ts] for ts in timestamps])
+    return timestamps, iot, edge
+
+
+def replay(model_path, timestamps, iot, edge, forecast="none", horizon=0.0, prev_action=0, guard=None):
+    """Placements the manager would have made, how long each decision took and how many were held.
+
+    With a `forecast` method, each decision is made on the CpuForecaster's
+    utilization `horizon` seconds ahead instead of the current sample; the
+    forecast is part of the measured latency. With a `guard`, every change
+    has to pass it like in the manager, and the next decision starts from
+    the placement that took effect, not the raw decision.
+    """
+    decisions = np.empty(len(iot), dtype=np.int64)
+    latencies = np.empty(len(iot))
+    held = 0
+    forecaster = om.CpuForecaster(forecast)
+    om.load_policy(model_path)  # Don't count the initial load as decision latency
+    for i, (now, iot_usage, edge_usage) in enumerate(zip(timestamps.tolist(), iot.tolist(), edge.tolist())):
+        start = time.perf_counter()
+        forecaster.observe({'iot': iot_usage, 'edge': edge_usage}, now)
+        predicted = forecaster.forecast(horizon)
+        action = om.make_offloading_decision(predicted['iot'], predicted['edge'], prev_action, model_path)
+        if guard is not None:
+            workload = om.Workload('Deployment', 'replay', 'workload', 1, {om.ROLE_LABEL: om.ROLES[prev_action]})
+            plan = om.Placement(workload, action, {om.ROLE_LABEL: om.ROLES[action]},
+                                predicted['iot'], predicted['edge'], (iot_usage, edge_usage), prev_action,
+                                om.compute_cost(iot_usage, edge_usage, action, prev_action), None)
+            allowed, _ = guard.allow(plan, now)
+            if not allowed:
+                held += 1
+                action = prev_action
+            elif action != prev_action:
+                guard.started(workload.key, now)
+                guard.finished(workload.key, guard.migration_seconds)
+        latencies[i] = time.perf_counter() - start
+        decisions[i] = prev_action = action
+    return decisions, latencies, held
+
+
+def placements(decisions, delay_steps, prev_action=0):
+    # Where the workload actually runs: a decision takes effect after the migration
+    if not delay_steps:
+        return decisions
+    return np.concatenate((np.full(min(delay_steps, len(decisions)), prev_action),
+                           decisions[:-delay_steps]))
+
+
+def summarize(iot, edge, decisions, latencies, beta, delay_steps=0, prev_action=0):
+    placed = placements(decisions, delay_steps, prev_action)
+    previous = np.concatenate(([prev_action], placed[:-1]))
+    om.BETA = beta  # compute_cost reads the module constant
+    cost = om.compute_cost(iot, edge, placed, previous)
+    return {
+        'beta': beta,
+        'decisions': len(decisions),
+        'total_cost': round(float(cost.sum()), 6),
+        'mean_cost': round(float(cost.mean()), 6),
+        'switches': int(np.count_nonzero(placed != previous)),
+        'edge_share': round(float(placed.mean()), 4),
+        'latency_mean_us': round(float(latencies.mean()) * 1e6, 2),
+        'latency_p99_us': round(float(np.percentile(latencies, 99)) * 1e6, 2),
+    }
+
+
+def parse_time(text):
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', help='replay this CSV instead of querying Prometheus')
+    parser.add_argument('--prometheus', default=om.PROMETHEUS_RANGE_URL,
+                        help='Prometheus query_range endpoint')
+    parser.add_argument('--iot_ip', help='node exporter IP of the IoT node')
+    parser.add_argument('--edge_ip', help='node exporter IP of the edge node')
+    parser.add_argument('--end', default=None, help='end of the history, unix time or ISO 8601, default now')
+    parser.add_argument('--days', type=float, default=7, help='length of the history')
+    parser.add_argument('--step', type=float, default=om.TICK_INTERVAL,
+                        help='seconds between replayed decisions')
+    parser.add_argument('--save_csv', help='write the fetched history to this CSV')
+    parser.add_argument('--models', nargs='+', default=[om.MODEL_PATH], help='pickled Q-tables to replay')
+    parser.add_argument('--beta', type=float, nargs='+', default=[om.BETA],
+                        help='BETA values to compute the cost with')
+    parser.add_argument('--forecast', nargs='+', default=[om.FORECAST_METHOD],
+                        choices=('holt', 'linear', 'none'), help='CPU forecast methods to decide on')
+    parser.add_argument('--migration_seconds', type=float, default=om.MIGRATION_SECONDS,
+                        help='delay until a decision takes effect, also the forecast horizon')
+    parser.add_argument('--no_guard', action='store_true',
+                        help='apply every decision, without the MigrationGuard')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    if args.csv:
+        timestamps, iot, edge = load_csv(args.csv)
+    else:
+        if not args.iot_ip or not args.edge_ip:
+            parser.error('--iot_ip and --edge_ip are needed without --csv')
+        om.PROMETHEUS_RANGE_URL = args.prometheus
+        end = parse_time(args.end) if args.end else time.time()
+        timestamps, iot, edge = fetch_prometheus(args.iot_ip, args.edge_ip,
+                                                 end - args.days * 86400, end, args.step)
+        if args.save_csv:
+            save_csv(args.save_csv, timestamps, iot, edge)
+    if not len(timestamps):
+        raise SystemExit('No samples to replay.')
+    print(f"Replaying {len(timestamps)} samples from "
+          f"{datetime.fromtimestamp(timestamps[0]):%Y-%m-%d %H:%M} to "
+          f"{datetime.fromtimestamp(timestamps[-1]):%Y-%m-%d %H:%M}.")
+
+    step = float(np.median(np.diff(timestamps))) if len(timestamps) > 1 else args.step
+    delay_steps = int(round(args.migration_seconds / step))
+
+    results = []
+    for model_path in args.models:
+        for forecast in args.forecast:
+            for beta in args.beta:
+                # The guard weighs the savings with compute_cost, so it is replayed per BETA
+                om.BETA = beta
+                guard = None if args.no_guard else om.MigrationGuard(migration_seconds=args.migration_seconds,
+                                                                     tick_interval=step)
+                decisions, latencies, held = replay(model_path, timestamps, iot, edge, forecast,
+                                                    args.migration_seconds, guard=guard)
+                result = summarize(iot, edge, decisions, latencies, beta, delay_steps)
+                result.update(model=model_path, forecast=forecast, held=held)
+                results.append(result)
+                print('{model} forecast={forecast} beta={beta}: total cost {total_cost:.4f} (mean {mean_cost:.4f}), '
+                      '{switches} switches, {held} held, {edge_share:.0%} on edge, '
+                      'decision {latency_mean_us} us mean / {latency_p99_us} us p99'.format(**result))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Offline Q-learning trainer and policy evaluator for the offloading manager.
+
+Simulates the offloading cost model of offloading_manager.py (compute_cost
+on the discretize_state state space) as a NumPy-vectorized environment that
+steps thousands of episodes at once, trains a Q-table on it and writes it
+in the pickled {state: q_values} format QTablePolicy loads.
+
+Train and export a new model, then compare it with the baselines:
+python3 train_q_table.py --episodes 20000 --output q_learning_model.pkl
+
+Retrain for different hardware or task constants:
+python3 train_q_table.py --c_edge 20e9 --phi 8000 --output q_learning_model.pkl
+
+Only evaluate existing models:
+python3 train_q_table.py --episodes 0 --evaluate q_learning_model.pkl other.pkl
+"""
+import argparse
+import pickle
+import time
+
+import numpy as np
+
+import offloading_manager as om
+
+
+class OffloadingEnv:
+    """`num_envs` independent episodes of the offloading task stepped as arrays.
+
+    The background CPU utilization of the IoT and the edge node follows a
+    mean-reverting random walk clipped to [0, 1]; each episode draws its own
+    long-run mean per node, so all load levels are visited. The task's cost
+    for a step is compute_cost() of the current utilizations, the chosen
+    node and the previous one.
+    """
+
+    def __init__(self, num_envs, reversion=0.1, volatility=0.05, seed=None):
+        self.num_envs = num_envs
+        self.reversion = reversion
+        self.volatility = volatility
+        self.rng = np.random.default_rng(seed)
+
+    def reset(self):
+        self.mean = self.rng.random((2, self.num_envs))
+        self.usage = self.rng.random((2, self.num_envs))
+        self.prev_action = self.rng.integers(0, om.NUM_ACTIONS, self.num_envs)
+        return self.state()
+
+    def state(self):
+        return om.discretize_state(self.usage[0], self.usage[1], self.prev_action)
+
+    def step(self, actions):
+        cost = om.compute_cost(self.usage[0], self.usage[1], actions, self.prev_action)
+        noise = self.rng.standard_normal(self.usage.shape)
+        self.usage = np.clip(self.usage + self.reversion * (self.mean - self.usage)
+                             + self.volatility * noise, 0.0, 1.0)
+        self.prev_action = actions
+        return self.state(), cost
+
+
+def q_table_policy(q_values):
+    """Greedy policy of a (iot_level, edge_level, prev_action, action) array."""
+    return lambda state: np.argmax(q_values[state], axis=-1)
+
+
+def constant_policy(action):
+    return lambda state: np.full(len(state[0]), action)
+
+
+def load_q_table(model_path):
+    """Dense Q-table of a pickled model, the same way QTablePolicy reads it."""
+    q_values = np.zeros((om.CPU_LEVELS, om.CPU_LEVELS, om.NUM_ACTIONS, om.NUM_ACTIONS))
+    with open(model_path, 'rb') as f:
+        for state, values in pickle.load(f).items():
+            q_values[state] = values
+    return q_values
+
+
+def train(env, episodes, steps, alpha=0.1, gamma=0.9, epsilon=(1.0, 0.05)):
+    """Epsilon-greedy Q-learning over batches of `env.num_envs` episodes.
+
+    Returns the Q-table and how often each (state, action) was updated.
+    Updates from a batch that hit the same (state, action) are averaged,
+    so the effective learning rate doesn't grow with the batch size.
+    Epsilon decays linearly from epsilon[0] to epsilon[1] over the batches.
+    """
+    q_values = np.zeros((om.CPU_LEVELS, om.CPU_LEVELS, om.NUM_ACTIONS, om.NUM_ACTIONS))
+    visits = np.zeros(q_values.shape, dtype=np.int64)
+    flat_q, flat_visits = q_values.reshape(-1), visits.reshape(-1)
+    batches = -(-episodes // env.num_envs)
+    for batch in range(batches):
+        eps = epsilon[0] + (epsilon[1] - epsilon[0]) * batch / max(batches - 1, 1)
+        state = env.reset()
+        for _ in range(steps):
+            actions = np.argmax(q_values[state], axis=-1)
+            explore = env.rng.random(env.num_envs) < eps
+            actions[explore] = env.rng.integers(0, om.NUM_ACTIONS, explore.sum())
+            next_state, cost = env.step(actions)
+
+            # Rewards are negative costs, so argmax picks the cheapest action
+            index = np.ravel_multi_index(state + (actions,), q_values.shape)
+            td_error = -cost + gamma * q_values[next_state].max(axis=-1) - flat_q[index]
+            counts = np.bincount(index, minlength=flat_q.size)
+            updated = counts > 0
+            flat_q[updated] += alpha * np.bincount(index, td_error, flat_q.size)[updated] / counts[updated]
+            flat_visits += counts
+            state = next_state
+    return q_values, visits
+
+
+def evaluate(policy, env, episodes, steps):
+    """Average per-step cost and switch rate of `policy` over `episodes`."""
+    total_cost = switches = 0.0
+    for _ in range(-(-episodes // env.num_envs)):
+        state = env.reset()
+        for _ in range(steps):
+            actions = policy(state)
+            switches += np.count_nonzero(actions != env.prev_action)
+            state, cost = env.step(actions)
+            total_cost += cost.sum()
+    samples = -(-episodes // env.num_envs) * env.num_envs * steps
+    return {'cost': total_cost / samples, 'switch_rate': switches / samples}
+
+
+def save_q_table(q_values, visits, model_path):
+    """Writes the visited states as {state: q_values}, like the shipped model.
+
+    The file is replaced atomically, so a running manager never hot-reloads
+    a half-written model.
+    """
+    model = {}
+    for state in zip(*np.nonzero(visits.sum(axis=-1))):
+        model[tuple(int(level) for level in state)] = q_values[state].copy()
+    om.write_model(pickle.dumps(model), model_path)
+    return len(model)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--episodes', type=int, default=20000,
+                        help='training episodes, 0 to only evaluate')
+    parser.add_argument('--steps', type=int, default=200, help='decisions per episode')
+    parser.add_argument('--num_envs', type=int, default=4096,
+                        help='episodes simulated in parallel')
+    parser.add_argument('--alpha', type=float, default=0.1, help='learning rate')
+    parser.add_argument('--gamma', type=float, default=0.9, help='discount factor')
+    parser.add_argument('--epsilon', type=float, nargs=2, default=(1.0, 0.05),
+                        metavar=('START', 'END'), help='exploration rate, decayed linearly')
+    parser.add_argument('--reversion', type=float, default=0.1,
+                        help='pull of the simulated CPU load towards its episode mean per step')
+    parser.add_argument('--volatility', type=float, default=0.05,
+                        help='standard deviation of the simulated CPU load change per step')
+    parser.add_argument('--phi', type=float, default=om.phi, help='CPU cycles per bit')
+    parser.add_argument('--task_size', type=float, default=om.H, help='task size in bits')
+    parser.add_argument('--c_iot', type=float, default=om.C_iot, help='IoT capacity in cycles/s')
+    parser.add_argument('--c_edge', type=float, default=om.C_edge, help='edge capacity in cycles/s')
+    parser.add_argument('--time_slice', type=float, default=om.T, help='time slice in seconds')
+    parser.add_argument('--beta', type=float, default=om.BETA,
+                        help='weight of the latency cost against the switching cost')
+    parser.add_argument('--output', help='write the trained Q-table to this file')
+    parser.add_argument('--evaluate', nargs='*', default=[],
+                        help='pickled models to evaluate alongside the trained one')
+    parser.add_argument('--eval_episodes', type=int, default=4096)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # compute_cost reads the module constants, so overriding them retrains for new hardware
+    om.phi, om.H, om.C_iot, om.C_edge = args.phi, args.task_size, args.c_iot, args.c_edge
+    om.T, om.BETA = args.time_slice, args.beta
+
+    policies = {'always iot': constant_policy(0), 'always edge': constant_policy(1)}
+    if args.episodes:
+        env = OffloadingEnv(args.num_envs, args.reversion, args.volatility, args.seed)
+        start = time.monotonic()
+        q_values, visits = train(env, args.episodes, args.steps, args.alpha, args.gamma, args.epsilon)
+        print(f"Trained on {args.episodes} episodes x {args.steps} steps in {time.monotonic() - start:.1f}s, "
+              f"{np.count_nonzero(visits.sum(axis=-1))} states visited.")
+        policies['trained'] = q_table_policy(q_values)
+        if args.output:
+            print(f"Wrote {save_q_table(q_values, visits, args.output)} states to '{args.output}'.")
+    for model_path in args.evaluate:
+        policies[model_path] = q_table_policy(load_q_table(model_path))
+
+    for name, policy in policies.items():
+        # Same seed for every policy, so they face identical load traces
+        env = OffloadingEnv(args.num_envs, args.reversion, args.volatility, args.seed + 1)
+        result = evaluate(policy, env, args.eval_episodes, args.steps)
+        print(f"{name}: average cost {result['cost']:.4f}, switch rate {result['switch_rate']:.4f}")
+
+
+if __name__ == '__main__':
+    main()